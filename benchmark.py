@@ -0,0 +1,922 @@
+# Offline benchmark and load test for rainbetbot.
+#
+# Drives the real command callbacks and reaction handlers against in-process fakes: a fake guild,
+# members and interactions instead of Discord, a loopback HTTP server serving a synthetic affiliates
+# payload instead of Rainbet, and an in-memory connection pool behind the bot's own DatabasePool
+# instead of Postgres. Needs no network access and no credentials.
+#
+#   python benchmark.py                                  # every scenario with the defaults
+#   python benchmark.py progress link --users 50 --iterations 40 --affiliates 100000
+#   python benchmark.py tournament --discord-latency 50 --db-latency 2
+#   python benchmark.py lookups                          # micro-benchmarks of the lookup structures
+#   python benchmark.py parsing                          # streaming vs whole-body parsing of the affiliates payload
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import random
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import psycopg2.extensions
+from aiohttp import web
+
+import rainbetbot
+
+SCENARIOS = (
+    "progress", "link", "link_import", "link_export", "list_milestones", "tournament", "reactions", "lookups", "parsing"
+)
+
+
+# ===== In-memory database =====
+class InMemoryStore:
+    # The tables the benchmarked code paths touch, as plain Python containers. Statements are matched
+    # on their normalised text; an unknown statement raises, so new queries can't slip by unnoticed.
+    # Every statement applies immediately, there is no transaction rollback.
+    def __init__(self, latency: float):
+        self.latency = latency  # seconds slept per statement, in the worker thread like a real round trip
+        self._lock = threading.Lock()
+        self.account_links = {}       # discord_id -> (rainbet_username, kick_username)
+        self.milestones = []          # (guild_id, amount, role_id, reward)
+        self.guild_config = {}        # guild_id -> field values
+        self.wager_latest = {}        # (window_start, username) -> (amount, captured_at)
+        self.wager_snapshots = {}     # (username, window_start, captured_at) -> amount
+        self.tournaments = {}         # message_id -> dict
+        self.reaction_events = []     # (message_id, user_id, added)
+        self.tournament_winners = {}  # (guild_id, user_id) -> wins
+        self.pinned_messages = {}     # key -> (channel_id, message_id, content_hash)
+        self.statements = 0
+        self._handlers = (
+            ("SELECT 1", lambda params: ([(1,)], 1)),
+            ("SELECT pg_advisory_xact_lock", lambda params: ([(None,)], 1)),
+            ("SELECT rainbet_username, kick_username FROM account_links", self._select_link),
+            ("SELECT discord_id, rainbet_username FROM account_links WHERE discord_id = ANY", self._select_links),
+            ("SELECT discord_id, rainbet_username FROM account_links", self._select_all_links),
+            ("SELECT discord_id, rainbet_username, kick_username FROM account_links", self._export_links),
+            ("INSERT INTO account_links", self._upsert_link),
+            ("DELETE FROM account_links", self._delete_link),
+            ("SELECT milestone_amount, reward_role_id, reward_text FROM milestones", self._select_milestones),
+            ("INSERT INTO milestones", self._insert_milestone),
+            ("UPDATE milestones", self._update_milestone),
+            ("DELETE FROM milestones", self._delete_milestone),
+            ("SELECT guild_id, ", self._select_guild_configs),
+            ("INSERT INTO guild_config", self._upsert_guild_config),
+            ("UPDATE pinned_messages SET key", self._rekey_pinned_message),
+            ("SELECT channel_id, message_id, content_hash FROM pinned_messages", self._select_pinned_message),
+            ("INSERT INTO pinned_messages", self._upsert_pinned_message),
+            ("SELECT username, wagered_amount FROM wager_latest", self._select_wager_latest),
+            ("INSERT INTO wager_snapshots", self._insert_wager_snapshots),
+            ("INSERT INTO wager_latest", self._upsert_wager_latest),
+            ("SELECT (captured_at AT TIME ZONE 'UTC')::date", self._select_daily_trend),
+            ("SELECT message_id, guild_id, channel_id, final_four FROM tournaments", self._select_open_tournaments),
+            ("SELECT message_id, user_id, added FROM tournament_reaction_events", self._select_reaction_events),
+            ("INSERT INTO tournaments", self._insert_tournament),
+            ("INSERT INTO tournament_reaction_events", self._insert_reaction_events),
+            ("DELETE FROM tournament_reaction_events", self._delete_reaction_events),
+            ("UPDATE tournaments SET final_four", self._set_final_four),
+            ("UPDATE tournaments SET status = 'finished'", self._finish_tournament),
+            ("INSERT INTO tournament_winners", self._record_winner),
+            ("SELECT user_id, wins FROM tournament_winners", self._select_winners),
+        )
+
+    def execute(self, query: str, params):
+        # Returns (rows, rowcount)
+        statement = " ".join(query.split())
+        for prefix, handler in self._handlers:
+            if statement.startswith(prefix):
+                break
+        else:
+            raise NotImplementedError(f"In-memory database does not support: {statement[:80]}")
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.statements += 1
+            return handler(params)
+
+    def _select_link(self, params):
+        row = self.account_links.get(params[0])
+        return ([row] if row else []), int(row is not None)
+
+    def _select_all_links(self, params):
+        rows = [(discord_id, rainbet) for discord_id, (rainbet, _) in self.account_links.items()]
+        return rows, len(rows)
+
+    def _select_links(self, params):
+        rows = [(d, self.account_links[d][0]) for d in params[0] if d in self.account_links]
+        return rows, len(rows)
+
+    def _export_links(self, params):
+        rows = [(discord_id, *link) for discord_id, link in sorted(self.account_links.items())]
+        return rows, len(rows)
+
+    def _upsert_link(self, params):
+        if isinstance(params, list):
+            # Bulk upsert through execute_values
+            for discord_id, rainbet, kick in params:
+                self.account_links[discord_id] = (rainbet, kick)
+            return [], len(params)
+        self.account_links[params[0]] = (params[1], params[2])
+        return [], 1
+
+    def _delete_link(self, params):
+        return [], int(self.account_links.pop(params[0], None) is not None)
+
+    def _select_milestones(self, params):
+        rows = sorted((amount, role_id, reward) for guild_id, amount, role_id, reward in self.milestones if guild_id == params[0])
+        return rows, len(rows)
+
+    def _insert_milestone(self, params):
+        guild_id, amount, role_id, reward = params
+        self.milestones.append((guild_id, float(amount), role_id, reward))
+        return [], 1
+
+    def _update_milestone(self, params):
+        new_amount, role_id, reward, guild_id, old_amount = params
+        updated = 0
+        for i, row in enumerate(self.milestones):
+            if row[0] == guild_id and row[1] == float(old_amount):
+                self.milestones[i] = (guild_id, float(new_amount), role_id, reward)
+                updated += 1
+        return [], updated
+
+    def _delete_milestone(self, params):
+        guild_id, amount = params
+        kept = [row for row in self.milestones if not (row[0] == guild_id and row[1] == float(amount))]
+        deleted, self.milestones = len(self.milestones) - len(kept), kept
+        return [], deleted
+
+    def _select_guild_configs(self, params):
+        rows = [(guild_id, *values) for guild_id, values in self.guild_config.items()]
+        return rows, len(rows)
+
+    def _upsert_guild_config(self, params):
+        self.guild_config[params[0]] = tuple(params[1:])
+        return [], 1
+
+    def _rekey_pinned_message(self, params):
+        new_key, old_key = params
+        row = self.pinned_messages.pop(old_key, None)
+        if row is not None:
+            self.pinned_messages[new_key] = row
+        return [], int(row is not None)
+
+    def _select_pinned_message(self, params):
+        row = self.pinned_messages.get(params[0])
+        return ([row] if row else []), int(row is not None)
+
+    def _upsert_pinned_message(self, params):
+        self.pinned_messages[params[0]] = tuple(params[1:])
+        return [], 1
+
+    def _select_wager_latest(self, params):
+        rows = [(username, amount) for (window, username), (amount, _) in self.wager_latest.items() if window == params[0]]
+        return rows, len(rows)
+
+    def _insert_wager_snapshots(self, rows):
+        inserted = 0
+        for username, window_start, captured_at, amount in rows:
+            if (username, window_start, captured_at) not in self.wager_snapshots:
+                self.wager_snapshots[(username, window_start, captured_at)] = amount
+                inserted += 1
+        return [], inserted
+
+    def _upsert_wager_latest(self, rows):
+        written = []
+        for window_start, username, amount, captured_at in rows:
+            previous = self.wager_latest.get((window_start, username))
+            if previous is None or previous[0] != amount:
+                self.wager_latest[(window_start, username)] = (amount, captured_at)
+                written.append((username, amount))
+        return written, len(written)
+
+    def _select_daily_trend(self, params):
+        username, days = params
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        daily = {}
+        for (snapshot_user, _, captured_at), amount in self.wager_snapshots.items():
+            if snapshot_user == username and captured_at >= cutoff:
+                day = captured_at.date()
+                daily[day] = max(daily.get(day, amount), amount)
+        rows = sorted(daily.items())
+        return rows, len(rows)
+
+    def _select_open_tournaments(self, params):
+        rows = [
+            (message_id, t["guild_id"], t["channel_id"], t["final_four"])
+            for message_id, t in sorted(self.tournaments.items(), key=lambda item: item[1]["created_at"])
+            if t["status"] == "open"
+        ]
+        return rows, len(rows)
+
+    def _select_reaction_events(self, params):
+        message_ids = set(params[0])
+        rows = [event for event in self.reaction_events if event[0] in message_ids]
+        return rows, len(rows)
+
+    def _insert_tournament(self, params):
+        message_id, guild_id, channel_id = params
+        self.tournaments[message_id] = {
+            "guild_id": guild_id, "channel_id": channel_id, "status": "open",
+            "final_four": [], "created_at": time.monotonic(),
+        }
+        return [], 1
+
+    def _insert_reaction_events(self, rows):
+        self.reaction_events.extend(rows)
+        return [], len(rows)
+
+    def _delete_reaction_events(self, params):
+        before = len(self.reaction_events)
+        self.reaction_events = [event for event in self.reaction_events if event[0] != params[0]]
+        return [], before - len(self.reaction_events)
+
+    def _set_final_four(self, params):
+        final_four, message_id = params
+        self.tournaments[message_id]["final_four"] = list(final_four)
+        return [], 1
+
+    def _finish_tournament(self, params):
+        self.tournaments[params[0]]["status"] = "finished"
+        return [], 1
+
+    def _record_winner(self, params):
+        key = tuple(params)
+        self.tournament_winners[key] = self.tournament_winners.get(key, 0) + 1
+        return [], 1
+
+    def _select_winners(self, params):
+        wins = [(user_id, wins) for (guild_id, user_id), wins in self.tournament_winners.items() if guild_id == params[0]]
+        rows = sorted(wins, key=lambda item: -item[1])[:10]
+        return rows, len(rows)
+
+class InMemoryCursor:
+    def __init__(self, store: InMemoryStore):
+        self.store = store
+        self.rowcount = -1
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query: str, params=None):
+        self._rows, self.rowcount = self.store.execute(query, params)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+class InMemoryConnection:
+    closed = 0
+
+    def __init__(self, store: InMemoryStore):
+        self.store = store
+
+    def cursor(self, name=None):
+        # Named (server-side) cursors behave like client-side ones here
+        return InMemoryCursor(self.store)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+class InMemoryConnectionPool:
+    # Stand-in for psycopg2's ThreadedConnectionPool, including the _pool list DatabasePool.stats() reads
+    def __init__(self, store: InMemoryStore, size: int):
+        self.store = store
+        self._pool = [InMemoryConnection(store) for _ in range(size)]
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        with self._lock:
+            return self._pool.pop()
+
+    def putconn(self, conn, close=False):
+        with self._lock:
+            self._pool.append(InMemoryConnection(self.store) if close else conn)
+
+    def closeall(self):
+        self._pool = []
+
+def execute_values(cursor, query, argslist, template=None, page_size=100, fetch=False):
+    # psycopg2's execute_values renders the VALUES list through libpq; hand the rows over as they are
+    cursor.execute(query, list(argslist))
+    if fetch:
+        return cursor.fetchall()
+
+def install_in_memory_database(latency: float):
+    store = InMemoryStore(latency)
+    db = rainbetbot.db
+    db._pool = InMemoryConnectionPool(store, db.maxconn)
+    db._slots = asyncio.Semaphore(db.maxconn)
+    rainbetbot.execute_values = execute_values
+    return store
+
+
+# ===== Rainbet stand-in =====
+def affiliate_payload(size: int, seed: int = 1):
+    rng = random.Random(seed)
+    return {
+        "affiliates": [
+            {"username": f"Player{i}", "wagered_amount": f"{rng.uniform(0, 100_000):.2f}"}
+            for i in range(size)
+        ]
+    }
+
+class AffiliateServer:
+    # Serves one pre-encoded affiliates payload on a loopback port, optionally after a fixed delay
+    def __init__(self, size: int, latency: float):
+        self.body = json.dumps(affiliate_payload(size)).encode()
+        self.latency = latency
+        self.requests = 0
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/v1/external/affiliates", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://127.0.0.1:{port}/v1/external/affiliates"
+
+    async def handle(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(body=self.body, content_type="application/json")
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+# ===== Fake Discord =====
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+
+    def is_default(self):
+        return False
+
+    @property
+    def mention(self):
+        return f"<@&{self.id}>"
+
+class FakeMember:
+    def __init__(self, world, guild, member_id: int):
+        self.world = world
+        self.guild = guild
+        self.id = member_id
+        self.name = self.display_name = f"user{member_id}"
+        self.bot = False
+        self.roles = []
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    async def add_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.world.api_call()
+            if role not in self.roles:
+                self.roles.append(role)
+            self.world.role_edits += 1
+
+    async def remove_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.world.api_call()
+            if role in self.roles:
+                self.roles.remove(role)
+            self.world.role_edits += 1
+
+class FakeMessage:
+    def __init__(self, world, channel, message_id: int, content):
+        self.world = world
+        self.channel = channel
+        self.id = message_id
+        self.content = content
+
+    async def add_reaction(self, emoji):
+        await self.world.api_call()
+
+    async def edit(self, *, content):
+        await self.world.api_call()
+        self.content = content
+
+    async def pin(self):
+        await self.world.api_call()
+
+class FakeChannel:
+    def __init__(self, world, guild, channel_id: int):
+        self.world = world
+        self.guild = guild
+        self.id = channel_id
+
+    @property
+    def mention(self):
+        return f"<#{self.id}>"
+
+    async def send(self, content=None, **kwargs):
+        await self.world.api_call()
+        return FakeMessage(self.world, self, self.world.next_id(), content)
+
+    def get_partial_message(self, message_id: int):
+        return FakeMessage(self.world, self, message_id, None)
+
+class FakeGuild:
+    def __init__(self, world, guild_id: int):
+        self.world = world
+        self.id = guild_id
+        self.roles = []
+        self._roles = {}
+        self.channels = {}
+        self.members = {}
+
+    def add_role(self, name: str):
+        role = FakeRole(self.world.next_id(), name)
+        self.roles.append(role)
+        self._roles[role.id] = role
+        return role
+
+    def add_channel(self):
+        channel = FakeChannel(self.world, self, self.world.next_id())
+        self.channels[channel.id] = channel
+        return channel
+
+    def add_member(self):
+        member = FakeMember(self.world, self, self.world.next_id())
+        self.members[member.id] = member
+        return member
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+    def get_role(self, role_id: int):
+        return self._roles.get(role_id)
+
+    def get_member(self, member_id: int):
+        return self.members.get(member_id)
+
+    async def fetch_member(self, member_id: int):
+        await self.world.api_call()
+        return self.members[member_id]
+
+    async def query_members(self, *, user_ids, limit=5, cache=True, **kwargs):
+        await self.world.api_call()
+        return [self.members[member_id] for member_id in user_ids if member_id in self.members]
+
+class FakeAttachment:
+    def __init__(self, attachment_id: int, filename: str, data: bytes):
+        self.id = attachment_id
+        self.filename = filename
+        self.size = len(data)
+        self._data = data
+
+    async def read(self):
+        return self._data
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, *, ephemeral=False, thinking=False):
+        await self._respond(None)
+
+    async def send_message(self, content=None, *, ephemeral=False, **kwargs):
+        await self._respond(content)
+
+    async def _respond(self, content):
+        if self._done:
+            raise RuntimeError("This interaction has already been responded to")
+        self._done = True
+        await self._interaction.world.api_call()
+        self._interaction.acked_at = time.perf_counter()
+        if content is not None:
+            self._interaction.replies.append(content)
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, *, ephemeral=False, **kwargs):
+        await self._interaction.world.api_call()
+        self._interaction.replies.append(content)
+
+class FakeInteraction:
+    def __init__(self, world, user, channel, command):
+        self.world = world
+        self.guild = channel.guild
+        self.guild_id = channel.guild.id
+        self.user = user
+        self.channel = channel
+        self.channel_id = channel.id
+        self.command = command
+        self.extras = {}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.replies = []
+        self.acked_at = None
+
+class World:
+    # One fake guild with a progress channel, milestone roles, simulated members and one
+    # channel per member for the tournament scenario, plus the counters the report prints.
+    def __init__(self, users: int, tiers: int, reactors: int, discord_latency: float):
+        self.discord_latency = discord_latency
+        self._ids = itertools.count(10 ** 17)
+        self.guild = FakeGuild(self, self.next_id())
+        self.progress_channel = self.guild.add_channel()
+        self.affiliate_role = self.guild.add_role("Degen Syndicate")
+        self.tier_roles = [self.guild.add_role(f"Tier {i + 1}") for i in range(tiers)]
+        self.admin = self.guild.add_member()
+        self.members = [self.guild.add_member() for _ in range(users)]
+        self.tournament_channels = [self.guild.add_channel() for _ in range(users)]
+        self.reactor_ids = [self.next_id() for _ in range(reactors)]
+        self.api_calls = 0
+        self.role_edits = 0
+        self.reset()
+
+    def next_id(self):
+        return next(self._ids)
+
+    def reset(self):
+        self.samples = {}      # label -> [seconds until the command returned]
+        self.ack_samples = {}  # label -> [seconds until the interaction was acknowledged]
+        self.exceptions = []
+        self.failed_replies = 0
+
+    async def api_call(self):
+        self.api_calls += 1
+        if self.discord_latency:
+            await asyncio.sleep(self.discord_latency)
+        else:
+            await asyncio.sleep(0)
+
+    async def invoke(self, command, invoker, channel=None, **params):
+        # Mirrors CommandTree dispatch: interaction_check, the callback, then latency bookkeeping
+        interaction = FakeInteraction(self, invoker, channel or self.progress_channel, command)
+        started = time.perf_counter()
+        await rainbetbot.bot.tree.interaction_check(interaction)
+        failed = False
+        try:
+            await command.callback(interaction, **params)
+        except Exception as e:
+            failed = True
+            self.exceptions.append(f"/{command.name}: {e!r}")
+        finally:
+            rainbetbot.record_command_latency(interaction, failed=failed)
+        finished = time.perf_counter()
+        self.samples.setdefault(command.name, []).append(finished - started)
+        if interaction.acked_at is not None:
+            self.ack_samples.setdefault(command.name, []).append(interaction.acked_at - started)
+        if any(reply and reply.startswith(("❌", "⏳")) for reply in interaction.replies):
+            self.failed_replies += 1
+        return interaction
+
+    async def react(self, message_id: int, user_id: int, added: bool):
+        payload = SimpleNamespace(
+            emoji=rainbetbot.TOURNAMENT_EMOJI, user_id=user_id, message_id=message_id,
+            channel_id=None, guild_id=self.guild.id,
+        )
+        handler = rainbetbot.on_raw_reaction_add if added else rainbetbot.on_raw_reaction_remove
+        started = time.perf_counter()
+        await handler(payload)
+        self.samples.setdefault(handler.__name__, []).append(time.perf_counter() - started)
+
+    def counters(self, store: InMemoryStore, server: AffiliateServer):
+        return {
+            "db statements": store.statements,
+            "discord calls": self.api_calls,
+            "role edits": self.role_edits,
+            "rainbet requests": server.requests,
+        }
+
+
+# ===== Scenarios =====
+async def progress_step(world, index: int, iteration: int):
+    await world.invoke(rainbetbot.progress, world.members[index])
+
+async def link_step(world, index: int, iteration: int):
+    # A different Rainbet account each time, so job-pool dedup and the ranking move every call
+    player = (index + iteration * len(world.members)) % world.affiliates
+    await world.invoke(
+        rainbetbot.link, world.admin, user=world.members[index], rainbet=f"Player{player}", kick=f"kick{player}"
+    )
+
+async def link_import_step(world, index: int, iteration: int):
+    # A CSV of --import-rows links: the simulated members first, then IDs that aren't in the guild
+    lines = ["discord_id,rainbet,kick"]
+    for row in range(world.import_rows):
+        member_id = world.members[row].id if row < len(world.members) else world.next_id()
+        player = (row + iteration * world.import_rows) % world.affiliates
+        lines.append(f"{member_id},Player{player},kick{player}")
+    attachment = FakeAttachment(world.next_id(), "links.csv", "\n".join(lines).encode())
+    await world.invoke(rainbetbot.link_import, world.admin, file=attachment)
+
+async def link_export_setup(world, store):
+    # A fixed table of --export-rows links, whatever earlier scenarios left behind
+    world.saved_links = store.account_links
+    store.account_links = {
+        str(world.next_id()): (f"Player{row % world.affiliates}", f"kick{row}") for row in range(world.export_rows)
+    }
+
+async def link_export_step(world, index: int, iteration: int):
+    await world.invoke(rainbetbot.link_export, world.admin, file_format="json" if iteration % 2 else "csv")
+
+async def link_export_teardown(world, store):
+    store.account_links = world.saved_links
+
+async def list_milestones_step(world, index: int, iteration: int):
+    await world.invoke(rainbetbot.list_milestones, world.members[index])
+
+async def tournament_step(world, index: int, iteration: int):
+    # A full tournament in this user's own channel: start, registrations, draw, backup, winner
+    channel = world.tournament_channels[index]
+    await world.invoke(rainbetbot.tournament_start, world.admin, channel)
+    tournament = rainbetbot.tournament_store.for_channel(channel.id)
+    for user_id in world.reactor_ids:
+        await world.react(tournament.message_id, user_id, True)
+    await world.invoke(rainbetbot.tournament_close, world.admin, channel)
+    await world.invoke(rainbetbot.tournament_draw_backup, world.admin, channel)
+    await world.invoke(rainbetbot.tournament_winner, world.admin, channel, user=world.members[index])
+
+async def reactions_setup(world, store):
+    channel = world.progress_channel
+    await world.invoke(rainbetbot.tournament_start, world.admin, channel)
+    world.reaction_message_id = rainbetbot.tournament_store.for_channel(channel.id).message_id
+    world.reset()
+
+async def reactions_step(world, index: int, iteration: int):
+    # Every simulated user toggles their registration on the one shared tournament
+    await world.react(world.reaction_message_id, world.members[index].id, iteration % 2 == 0)
+
+async def reactions_teardown(world, store):
+    started = time.perf_counter()
+    await rainbetbot.tournament_store.flush()
+    world.samples["tournament_store.flush"] = [time.perf_counter() - started]
+
+SCENARIO_STEPS = {
+    # name -> (setup, step, teardown)
+    "progress": (None, progress_step, None),
+    "link": (None, link_step, None),
+    "link_import": (None, link_import_step, None),
+    "link_export": (link_export_setup, link_export_step, link_export_teardown),
+    "list_milestones": (None, list_milestones_step, None),
+    "tournament": (None, tournament_step, None),
+    "reactions": (reactions_setup, reactions_step, reactions_teardown),
+}
+
+
+# ===== Runner =====
+def percentile(ordered, q: float):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def format_latencies(samples):
+    ordered = sorted(samples)
+    return (
+        f"p50 {percentile(ordered, 0.50) * 1000:8.2f}ms | p95 {percentile(ordered, 0.95) * 1000:8.2f}ms | "
+        f"p99 {percentile(ordered, 0.99) * 1000:8.2f}ms | max {ordered[-1] * 1000:8.2f}ms"
+    )
+
+async def seed(world, store: InMemoryStore, affiliates: int, tiers: int):
+    guild_id = str(world.guild.id)
+    for i, role in enumerate(world.tier_roles):
+        amount = round(100_000 * (i + 1) / (tiers + 1), 2)
+        store.milestones.append((guild_id, amount, str(role.id), f"Reward {i + 1}"))
+    for i, member in enumerate(world.members):
+        player = i % affiliates
+        store.account_links[str(member.id)] = (f"Player{player}", f"kick{player}")
+
+    await rainbetbot.guild_configs.load()
+    await rainbetbot.guild_configs.update(
+        world.guild.id, progress_channel_id=world.progress_channel.id, affiliate_role_id=world.affiliate_role.id
+    )
+    window_start = rainbetbot.current_month_window()[0]
+    await rainbetbot.wager_history.load(window_start)
+    await rainbetbot.account_link_index.load()
+    rainbetbot.wager_ranking.rebuild(
+        window_start, rainbetbot.wager_history.latest(window_start), rainbetbot.account_link_index.links()
+    )
+
+async def run_scenario(name: str, world, store, server, users: int, iterations: int):
+    setup, step, teardown = SCENARIO_STEPS[name]
+    if setup:
+        await setup(world, store)
+    world.reset()
+    before = world.counters(store, server)
+    # Event-loop lag is reported per scenario
+    rainbetbot.metrics.histograms.pop(("event_loop_lag_seconds", "loop"), None)
+
+    async def simulated_user(index: int):
+        for iteration in range(iterations):
+            await step(world, index, iteration)
+
+    # The bot logs every link and similar events with print; keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        await asyncio.gather(*(simulated_user(index) for index in range(users)))
+        elapsed = time.perf_counter() - started
+    if teardown:
+        await teardown(world, store)
+
+    calls = sum(len(samples) for label, samples in world.samples.items() if label != "tournament_store.flush")
+    print(f"\n== {name}: {users} users x {iterations} iterations – {calls} calls in {elapsed:.2f}s ({calls / elapsed:,.0f} calls/s)")
+    for label, samples in sorted(world.samples.items()):
+        print(f"  {label:<24} n={len(samples):<7} {format_latencies(samples)}")
+        if label in world.ack_samples:
+            print(f"  {'  acknowledged':<24} {'':<9} {format_latencies(world.ack_samples[label])}")
+    after = world.counters(store, server)
+    print("  " + " | ".join(f"{key}: {after[key] - before[key]}" for key in after))
+    print(f"  exceptions: {len(world.exceptions)} | failed replies: {world.failed_replies}", end="")
+    lag = rainbetbot.metrics.histograms.get(("event_loop_lag_seconds", "loop"))
+    print(f" | event-loop lag max: {lag.max * 1000:.1f}ms" if lag else "")
+    for exception in world.exceptions[:5]:
+        print(f"  ⚠️ {exception}")
+
+async def run_load_test(args, scenarios):
+    server = AffiliateServer(args.affiliates, args.api_latency)
+    rainbetbot.rainbet_client.base_url = await server.start()
+    store = install_in_memory_database(args.db_latency)
+    rainbetbot.role_reconciler.rate = args.role_edit_rate
+    rainbetbot.bot._connection.user = SimpleNamespace(id=10 ** 16, name="rainbetbot")
+    lag_monitor = asyncio.create_task(rainbetbot.monitor_event_loop_lag())
+
+    world = World(args.users, args.tiers, args.reactions, args.discord_latency / 1000)
+    world.affiliates = args.affiliates
+    world.import_rows = args.import_rows
+    world.export_rows = args.export_rows
+    await seed(world, store, args.affiliates, args.tiers)
+
+    # Cold snapshot fetch once, so the scenarios measure the steady state
+    started = time.perf_counter()
+    snapshot = await rainbetbot.affiliate_cache.get(*rainbetbot.current_month_window())
+    print(f"Affiliate snapshot: {len(snapshot)} entries, first fetch and index {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    try:
+        for name in scenarios:
+            await run_scenario(name, world, store, server, args.users, args.iterations)
+        print("\n== metrics recorded by the bot")
+        for kind in ("db", "rainbet"):
+            for target in rainbetbot.metrics.targets(f"{kind}_duration_seconds"):
+                histogram = rainbetbot.metrics.histograms[(f"{kind}_duration_seconds", target)]
+                print(
+                    f"  {kind + ':' + target:<30} n={histogram.count:<7} avg {histogram.sum / histogram.count * 1000:8.2f}ms | "
+                    f"max {histogram.max * 1000:8.2f}ms"
+                )
+        pool = rainbetbot.db.stats()
+        print(f"  db pool: {pool['acquisitions']} acquisitions, avg wait {pool['avg_wait_ms']:.2f}ms, max wait {pool['max_wait_ms']:.2f}ms")
+    finally:
+        lag_monitor.cancel()
+        await rainbetbot.rainbet_client.close()
+        await server.stop()
+
+
+# ===== Lookup micro-benchmarks =====
+def time_per_call(fn, calls: int):
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls
+
+def benchmark_lookups():
+    # The structures behind /progress against the per-call scans they replaced
+    rng = random.Random(2)
+    print("\n== lookups: wagered amount by username")
+    for size in (1_000, 10_000, 100_000):
+        payload = affiliate_payload(size)
+        names = [f"player{rng.randrange(size)}" for _ in range(200)]
+
+        def linear_scan():
+            username = rng.choice(names)
+            for affiliate in payload.get("affiliates", []):
+                if affiliate["username"].lower() == username.lower():
+                    return float(affiliate["wagered_amount"])
+
+        started = time.perf_counter()
+        snapshot = rainbetbot.AffiliateSnapshot.from_payload(payload)
+        build = time.perf_counter() - started
+        scan = time_per_call(linear_scan, max(20, 200_000 // size))
+        indexed = time_per_call(lambda: snapshot.wagered(rng.choice(names)), 100_000)
+        print(
+            f"  {size:>7} affiliates: scan {scan * 1e6:10.1f}µs | index {indexed * 1e6:6.2f}µs "
+            f"| index build {build * 1000:7.1f}ms (once per fetch)"
+        )
+
+    print("\n== lookups: highest reached and next milestone")
+    for tiers in (10, 100, 500, 1000):
+        rows = sorted((round(rng.uniform(100, 1_000_000), 2), str(i), f"Reward {i}") for i in range(tiers))
+        table = rainbetbot.MilestoneTable(rows, 0)
+
+        def linear_resolve():
+            wagered = rng.uniform(0, 1_100_000)
+            highest_reached = next_milestone = None
+            for milestone in rows:
+                if wagered >= milestone[0]:
+                    highest_reached = milestone
+                elif not next_milestone:
+                    next_milestone = milestone
+            return highest_reached, next_milestone
+
+        linear = time_per_call(linear_resolve, 20_000)
+        bisected = time_per_call(lambda: table.resolve(rng.uniform(0, 1_100_000)), 100_000)
+        print(f"  {tiers:>5} tiers: linear {linear * 1e6:8.2f}µs | bisect {bisected * 1e6:6.2f}µs")
+
+
+# ===== Affiliates parsing =====
+def parse_whole_body(body: bytes):
+    # The previous path: response.json() on the whole body, then a username -> float dict
+    wagers = {}
+    for affiliate in json.loads(body).get("affiliates", []):
+        wagers.setdefault(affiliate["username"].casefold(), float(affiliate["wagered_amount"]))
+    return wagers
+
+def parse_streaming(body: bytes):
+    builder = rainbetbot.AffiliateSnapshotBuilder()
+    parser = rainbetbot.AffiliateStreamParser(builder.add)
+    for i in range(0, len(body), rainbetbot.AFFILIATE_STREAM_CHUNK):
+        parser.feed(body[i:i + rainbetbot.AFFILIATE_STREAM_CHUNK])
+    parser.close()
+    return builder.build()
+
+def benchmark_parsing():
+    # Retained is what the parsed result keeps alive; peak includes the body and all temporaries
+    print("\n== parsing: affiliates payload into a snapshot")
+    for size in (10_000, 100_000):
+        body = json.dumps(affiliate_payload(size)).encode()
+        print(f"  {size:>7} affiliates, {len(body) / 1e6:.1f}MB body")
+        for label, parse in (("whole body + dict", parse_whole_body), ("streaming + columns", parse_streaming)):
+            runs = []
+            for _ in range(3):
+                started = time.perf_counter()
+                parse(body)
+                runs.append(time.perf_counter() - started)
+            tracemalloc.start()
+            result = parse(body)
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del result
+            print(
+                f"    {label:<20} {min(runs) * 1000:7.1f}ms ({size / min(runs):>11,.0f} entries/s) | "
+                f"peak {peak / 1e6:6.1f}MB | retained {retained / 1e6:6.1f}MB"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline benchmark and load test for rainbetbot against fake Discord, Rainbet and database backends."
+    )
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), metavar="scenario",
+                        help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users (default: 20)")
+    parser.add_argument("--iterations", type=int, default=25, help="requests per simulated user (default: 25)")
+    parser.add_argument("--affiliates", type=int, default=10_000, help="entries in the affiliates payload (default: 10000)")
+    parser.add_argument("--tiers", type=int, default=20, help="milestone tiers in the guild (default: 20)")
+    parser.add_argument("--reactions", type=int, default=50, help="registrations per tournament (default: 50)")
+    parser.add_argument("--import-rows", type=int, default=500, help="rows per /link_import file (default: 500)")
+    parser.add_argument("--export-rows", type=int, default=2000, help="account links in the /link_export table (default: 2000)")
+    parser.add_argument("--discord-latency", type=float, default=0, help="ms per simulated Discord API call (default: 0)")
+    parser.add_argument("--api-latency", type=float, default=0, help="ms before the Rainbet stand-in answers (default: 0)")
+    parser.add_argument("--db-latency", type=float, default=0, help="ms per in-memory database statement (default: 0)")
+    parser.add_argument("--role-edit-rate", type=float, default=1000,
+                        help="member edits per second per guild; the bot runs with ROLE_EDIT_RATE (2) against real Discord "
+                             "(default: 1000, i.e. effectively unthrottled)")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    args.api_latency /= 1000
+    args.db_latency /= 1000
+
+    scenarios = [name for name in SCENARIOS if name in args.scenarios]
+    load_scenarios = [name for name in scenarios if name in SCENARIO_STEPS]
+    if load_scenarios:
+        asyncio.run(run_load_test(args, load_scenarios))
+    if "lookups" in scenarios:
+        benchmark_lookups()
+    if "parsing" in scenarios:
+        benchmark_parsing()
+
+if __name__ == "__main__":
+    main()
@@ -1,97 +1,1720 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 import os
 import psycopg2
-from datetime import datetime
-import requests
+import psycopg2.extensions
+import psycopg2.pool
+from psycopg2.extras import execute_values
+from datetime import datetime, timezone
+import aiohttp
 import random
+import asyncio
+import codecs
+import csv
+import hashlib
+import io
+import json
+import logging
+import re
+import sys
+import tempfile
+import time
+from aiohttp import web
+from array import array
+from collections import OrderedDict, deque
+from bisect import bisect_left, bisect_right, insort
 from calendar import monthrange
+from contextlib import contextmanager
+from typing import Literal
+
+class LeaderboardTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction):
+        # Start of the command's end-to-end latency, see record_command_latency
+        interaction.extras["started_at"] = time.perf_counter()
+        if interaction.command is not None:
+            metrics.add("command_in_flight", interaction.command.qualified_name, 1)
+        return True
+
+class LeaderboardBot(commands.AutoShardedBot):
+    async def setup_hook(self):
+        self.started_at = time.monotonic()
+        self.metrics_runner = await start_metrics_server() if METRICS_PORT else None
+        asyncio.create_task(monitor_event_loop_lag())
+        await db.open()
+        await run_migrations()
+        await guild_configs.load()
+        window_start = current_month_window()[0]
+        await wager_history.load(window_start)
+        await account_link_index.load()
+        wager_ranking.rebuild(window_start, wager_history.latest(window_start), account_link_index.links())
+        wager_history_maintenance.start()
+        if WAGER_SYNC_INTERVAL > 0:
+            wager_sync_loop.start()
+        await tournament_store.load()
+        tournament_flush_loop.start()
+        asyncio.create_task(reconcile_open_tournaments())
+
+    async def close(self):
+        if getattr(self, "metrics_runner", None) is not None:
+            await self.metrics_runner.cleanup()
+        await rainbet_client.close()
+        await super().close()
+        try:
+            await tournament_store.flush()
+        except Exception as e:
+            print(f"⚠️ Could not flush tournament reactions on shutdown: {e}")
+        db.close()
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.reactions = True  
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Sharding: leave unset to let Discord pick the shard count; set SHARD_COUNT and SHARD_IDS
+# (comma separated) to split the shards over several worker processes.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv("SHARD_IDS", "").split(",") if shard_id.strip()] or None
+
+def owns_guild(guild_id: int):
+    # Discord routes a guild to shard (guild_id >> 22) % shard_count; usable before the gateway connects
+    if SHARD_IDS is None:
+        return True
+    return (guild_id >> 22) % SHARD_COUNT in SHARD_IDS
+
+bot = LeaderboardBot(
+    command_prefix="!", intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS,
+    tree_cls=LeaderboardTree
+)
+
+# ===== Instrumentation =====
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 disables the Prometheus text endpoint
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+LOOP_LAG_INTERVAL = 0.5  # seconds between event-loop lag probes
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float):
+        # Upper bound of the bucket holding the q-quantile
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return bound
+        return self.max
+
+class Metrics:
+    # Counters, gauges and histograms keyed by (name, target). Only the event loop thread records,
+    # so plain dict updates are safe without locks and cost next to nothing on the hot paths.
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name: str, target: str, value: int = 1):
+        self.counters[(name, target)] = self.counters.get((name, target), 0) + value
+
+    def add(self, name: str, target: str, delta: float):
+        self.gauges[(name, target)] = self.gauges.get((name, target), 0) + delta
+
+    def set(self, name: str, target: str, value: float):
+        self.gauges[(name, target)] = value
+
+    def observe(self, name: str, target: str, value: float):
+        histogram = self.histograms.get((name, target))
+        if histogram is None:
+            histogram = self.histograms[(name, target)] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(value)
+
+    @contextmanager
+    def track(self, kind: str, target: str):
+        # Times the block into <kind>_duration_seconds and maintains <kind>_in_flight and <kind>_errors_total
+        self.add(f"{kind}_in_flight", target, 1)
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc(f"{kind}_errors_total", target)
+            raise
+        finally:
+            self.add(f"{kind}_in_flight", target, -1)
+            self.observe(f"{kind}_duration_seconds", target, time.perf_counter() - started)
+
+    def targets(self, name: str):
+        return sorted(target for metric, target in self.histograms if metric == name)
+
+    def render_prometheus(self):
+        lines = []
+        for (name, target), value in sorted({**self.counters, **self.gauges}.items()):
+            lines.append(f'leaderboardbot_{name}{{target="{target}"}} {value}')
+        for (name, target), histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip([*histogram.buckets, "+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f'leaderboardbot_{name}_bucket{{target="{target}",le="{bound}"}} {cumulative}')
+            lines.append(f'leaderboardbot_{name}_sum{{target="{target}"}} {histogram.sum}')
+            lines.append(f'leaderboardbot_{name}_count{{target="{target}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+async def monitor_event_loop_lag():
+    # A sleep that wakes up late means something held the loop, e.g. a blocking call
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, loop.time() - started - LOOP_LAG_INTERVAL)
+        metrics.observe("event_loop_lag_seconds", "loop", lag)
+        metrics.set("event_loop_lag_last_seconds", "loop", lag)
+
+def collect_gauges():
+    # Point-in-time values owned by the subsystems, copied in right before an export
+    pool = db.stats()
+    metrics.set("db_pool_connections", "in_use", pool["in_use"])
+    metrics.set("db_pool_connections", "idle", pool["idle"])
+    metrics.set("db_pool_acquire_timeouts", "pool", pool["timeouts"])
+    cache = affiliate_cache.stats()
+    for field in ("hits", "stale_hits", "misses", "fetches", "errors"):
+        metrics.set("affiliate_cache", field, cache[field])
+    jobs = job_pool.stats()
+    metrics.set("job_queue", "queued", jobs["queued"])
+    metrics.set("job_queue", "in_flight", jobs["in_flight"])
+    roles = role_reconciler.stats()
+    metrics.set("role_queue_depth", "roles", roles["queue_depth"])
+    metrics.set("rate_limited", "member_edits", roles["rate_limited"])
+    metrics.set("rate_limited", "all", roles["rate_limited_total"])
+    render = render_cache.stats()
+    for field in ("hits", "misses", "size"):
+        metrics.set("render_cache", field, render[field])
+    metrics.set("guilds", "bot", len(bot.guilds))
+    metrics.set("shards", "here", len(bot.shards))
+    metrics.set("shards", "total", bot.shard_count or 0)
+
+async def start_metrics_server():
+    # Prometheus text format on METRICS_HOST:METRICS_PORT/metrics; binds to localhost by default
+    async def handle_metrics(request):
+        collect_gauges()
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    print(f"📈 Metrics available on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return runner
+
 
 # ===== Database Setup =====
 DATABASE_URL = os.getenv("DATABASE_URL")  # Railway automatically sets this
 API_KEY = os.getenv("API_KEY")  # Assuming you have an API key as an environment variable
-# Replace with your actual allowed channel ID
-ALLOWED_COMMAND_CHANNEL_ID_FOR_LINK = 1368886520412377119 # <-- deinen Channel ID hier eintragen
-VERIFIED_ROLE_ID = 1368886448346107914
-def get_connection():
-    return psycopg2.connect(DATABASE_URL, sslmode='require')
-
-def init_db():
-    with get_connection() as conn:
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "10"))  # seconds to wait for a free connection
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "30"))  # ping connections idle longer than this
+
+class DatabasePoolTimeout(Exception):
+    pass
+
+class DatabasePool:
+    # psycopg2 connection pool behind an awaitable API. Queries run in worker threads so the
+    # event loop keeps serving the gateway; a semaphore bounds checkouts to the pool size.
+    def __init__(self, dsn: str, minconn: int, maxconn: int, acquire_timeout: float, health_check_interval: float):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self._pool = None
+        self._slots = None
+        self._last_used = {}  # id(conn) -> monotonic time it was returned
+        self.in_use = 0
+        self.acquisitions = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.health_check_failures = 0
+
+    async def open(self):
+        if self._pool is None:
+            self._pool = await asyncio.to_thread(
+                psycopg2.pool.ThreadedConnectionPool, self.minconn, self.maxconn, self.dsn, sslmode='require'
+            )
+            self._slots = asyncio.Semaphore(self.maxconn)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+    async def run(self, fn, *args, name=None):
+        # Calls fn(conn, *args) on a pooled connection inside one transaction and returns its result;
+        # name labels its timings in the db metrics (defaults to fn's name)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise DatabasePoolTimeout(f"No database connection available within {self.acquire_timeout:.0f}s")
+
+        waited = time.monotonic() - started
+        self.acquisitions += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        self.in_use += 1
+
+        future = asyncio.ensure_future(asyncio.to_thread(self._call, fn, args))
+        # Release the slot only once the worker thread is done, even if the caller is cancelled
+        future.add_done_callback(self._release)
+        with metrics.track("db", name or fn.__name__.lstrip("_")):
+            return await asyncio.shield(future)
+
+    def _release(self, _future):
+        self.in_use -= 1
+        self._slots.release()
+
+    def _call(self, fn, args):
+        conn = self._checkout()
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self._checkin(conn)
+
+    def _checkout(self):
+        conn = self._pool.getconn()
+        last_used = self._last_used.get(id(conn))
+        if conn.closed or (last_used is not None and time.monotonic() - last_used > self.health_check_interval):
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1;")
+                conn.rollback()
+            except psycopg2.Error:
+                self.health_check_failures += 1
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        return conn
+
+    def _checkin(self, conn):
+        if conn.closed:
+            self._last_used.pop(id(conn), None)
+            self._pool.putconn(conn, close=True)
+            return
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        self._last_used[id(conn)] = time.monotonic()
+        self._pool.putconn(conn)
+
+    async def execute(self, query: str, params=None, name=None):
+        def _execute(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                return cursor.rowcount
+        return await self.run(_execute, name=name)
+
+    async def fetchone(self, query: str, params=None, name=None):
+        def _fetchone(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                return cursor.fetchone()
+        return await self.run(_fetchone, name=name)
+
+    async def fetchall(self, query: str, params=None, name=None):
+        def _fetchall(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                return cursor.fetchall()
+        return await self.run(_fetchall, name=name)
+
+    def stats(self):
+        return {
+            "in_use": self.in_use,
+            # ThreadedConnectionPool keeps its idle connections in _pool
+            "idle": len(self._pool._pool) if self._pool is not None else 0,
+            "max_size": self.maxconn,
+            "acquisitions": self.acquisitions,
+            "avg_wait_ms": self.wait_total / self.acquisitions * 1000 if self.acquisitions else 0.0,
+            "max_wait_ms": self.wait_max * 1000,
+            "timeouts": self.timeouts,
+            "health_check_failures": self.health_check_failures,
+        }
+
+db = DatabasePool(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX, DB_ACQUIRE_TIMEOUT, DB_HEALTH_CHECK_INTERVAL)
+
+# ===== Schema Migrations =====
+# Applied once at startup in version order; command handlers only run DML.
+# Append new entries, never edit applied ones.
+MIGRATIONS = [
+    (1, "initial_schema", [
+        """
+        CREATE TABLE IF NOT EXISTS account_links (
+            discord_id TEXT PRIMARY KEY,
+            rainbet_username TEXT NOT NULL,
+            kick_username TEXT NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS milestones (
+            id SERIAL PRIMARY KEY,
+            guild_id TEXT NOT NULL,
+            milestone_amount REAL NOT NULL,
+            reward_role_id TEXT NOT NULL,
+            reward_text TEXT NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS tournament_winners (
+            user_id TEXT PRIMARY KEY,
+            wins INTEGER NOT NULL
+        );
+        """,
+    ]),
+    (2, "milestone_and_winner_indexes", [
+        "CREATE INDEX IF NOT EXISTS milestones_guild_amount_idx ON milestones (guild_id, milestone_amount);",
+        "CREATE INDEX IF NOT EXISTS tournament_winners_wins_idx ON tournament_winners (wins DESC);",
+    ]),
+    (3, "wager_history", [
+        # username is the case-folded Rainbet username, window_start the first day of the wager month
+        """
+        CREATE TABLE IF NOT EXISTS wager_snapshots (
+            username TEXT NOT NULL,
+            window_start DATE NOT NULL,
+            captured_at TIMESTAMPTZ NOT NULL,
+            wagered_amount DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (username, window_start, captured_at)
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS wager_snapshots_captured_idx ON wager_snapshots (captured_at);",
+        """
+        CREATE TABLE IF NOT EXISTS wager_latest (
+            window_start DATE NOT NULL,
+            username TEXT NOT NULL,
+            wagered_amount DOUBLE PRECISION NOT NULL,
+            captured_at TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (window_start, username)
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS wager_latest_amount_idx ON wager_latest (window_start, wagered_amount DESC);",
+    ]),
+    (4, "pinned_messages", [
+        """
+        CREATE TABLE IF NOT EXISTS pinned_messages (
+            key TEXT PRIMARY KEY,
+            channel_id TEXT NOT NULL,
+            message_id TEXT NOT NULL,
+            content_hash TEXT NOT NULL
+        );
+        """,
+    ]),
+    (5, "tournament_state", [
+        # status: open until a winner is recorded, then finished
+        """
+        CREATE TABLE IF NOT EXISTS tournaments (
+            message_id TEXT PRIMARY KEY,
+            guild_id TEXT NOT NULL,
+            channel_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'open',
+            final_four TEXT[] NOT NULL DEFAULT '{}',
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS tournaments_open_idx ON tournaments (created_at) WHERE status = 'open';",
+        """
+        CREATE TABLE IF NOT EXISTS tournament_reaction_events (
+            id BIGSERIAL PRIMARY KEY,
+            message_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            added BOOLEAN NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS tournament_reaction_events_message_idx ON tournament_reaction_events (message_id, id);",
+    ]),
+    (6, "guild_config", [
+        """
+        CREATE TABLE IF NOT EXISTS guild_config (
+            guild_id TEXT PRIMARY KEY,
+            link_channel_id TEXT,
+            verified_role_id TEXT,
+            progress_channel_id TEXT,
+            affiliate_role_id TEXT,
+            hall_of_fame_channel_id TEXT,
+            leaderboard_channel_id TEXT
+        );
+        """,
+    ]),
+    (7, "finish_superseded_tournaments", [
+        # Starting a tournament used to leave the channel's previous one open; only the newest was usable
+        """
+        UPDATE tournaments t SET status = 'finished'
+        WHERE t.status = 'open' AND EXISTS (
+            SELECT 1 FROM tournaments newer
+            WHERE newer.channel_id = t.channel_id AND newer.status = 'open' AND newer.created_at > t.created_at
+        );
+        """,
+        """
+        DELETE FROM tournament_reaction_events e
+        USING tournaments t
+        WHERE e.message_id = t.message_id AND t.status = 'finished';
+        """,
+    ]),
+    (8, "guild_tournament_winners", [
+        # Existing wins belong to the one configured guild if there is exactly one; otherwise they keep
+        # guild_id '' until adopt_legacy_guild_config assigns them to the original guild
+        "ALTER TABLE tournament_winners ADD COLUMN IF NOT EXISTS guild_id TEXT NOT NULL DEFAULT '';",
+        """
+        UPDATE tournament_winners SET guild_id = (SELECT guild_id FROM guild_config)
+        WHERE (SELECT COUNT(*) FROM guild_config) = 1;
+        """,
+        "ALTER TABLE tournament_winners DROP CONSTRAINT IF EXISTS tournament_winners_pkey;",
+        "ALTER TABLE tournament_winners ADD PRIMARY KEY (guild_id, user_id);",
+        "DROP INDEX IF EXISTS tournament_winners_wins_idx;",
+        "CREATE INDEX IF NOT EXISTS tournament_winners_guild_wins_idx ON tournament_winners (guild_id, wins DESC);",
+    ]),
+]
+MIGRATION_LOCK_ID = 7263418  # pg advisory lock so concurrent deployments don't migrate twice
+
+async def run_migrations():
+    def _migrate(conn):
         with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_ID,))
             cursor.execute("""
-                CREATE TABLE IF NOT EXISTS account_links (
-                    discord_id TEXT PRIMARY KEY,
-                    rainbet_username TEXT NOT NULL,
-                    kick_username TEXT NOT NULL
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
                 );
             """)
-            conn.commit()
+            cursor.execute("SELECT version FROM schema_migrations;")
+            applied = {row[0] for row in cursor.fetchall()}
+            pending = [m for m in MIGRATIONS if m[0] not in applied]
+            for version, name, statements in pending:
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);", (version, name))
+            return [f"{version}_{name}" for version, name, _ in pending]
+
+    applied = await db.run(_migrate, name="migrations")
+    if applied:
+        print(f"🗄️ Applied migrations: {', '.join(applied)}")
+
+async def link_accounts(discord_id: str, rainbet_username: str, kick_username: str):
+    await db.execute("""
+        INSERT INTO account_links (discord_id, rainbet_username, kick_username)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (discord_id) DO UPDATE SET
+            rainbet_username = EXCLUDED.rainbet_username,
+            kick_username = EXCLUDED.kick_username;
+    """, (discord_id, rainbet_username, kick_username), name="link_accounts")
+
+async def get_linked_accounts(discord_id: str):
+    return await db.fetchone(
+        "SELECT rainbet_username, kick_username FROM account_links WHERE discord_id = %s;", (discord_id,),
+        name="get_linked_accounts"
+    )
 
-def link_accounts(discord_id: str, rainbet_username: str, kick_username: str):
+async def get_all_linked_accounts():
+    return await db.fetchall("SELECT discord_id, rainbet_username FROM account_links;", name="get_all_linked_accounts")
 
-    with get_connection() as conn:
-        print("Connected to DB, about to execute INSERT.")
+async def unlink_accounts(discord_id: str):
+    return await db.execute("DELETE FROM account_links WHERE discord_id = %s;", (discord_id,), name="unlink_accounts")
+
+async def link_accounts_bulk(rows):
+    # Upserts (discord_id, rainbet_username, kick_username) rows with one statement in one transaction
+    # and returns the Rainbet usernames those discord_ids were linked to before
+    def _link_bulk(conn):
         with conn.cursor() as cursor:
-            cursor.execute("""
+            cursor.execute(
+                "SELECT discord_id, rainbet_username FROM account_links WHERE discord_id = ANY(%s);",
+                ([discord_id for discord_id, _, _ in rows],)
+            )
+            previous = dict(cursor.fetchall())
+            execute_values(cursor, """
                 INSERT INTO account_links (discord_id, rainbet_username, kick_username)
-                VALUES (%s, %s, %s)
+                VALUES %s
                 ON CONFLICT (discord_id) DO UPDATE SET
                     rainbet_username = EXCLUDED.rainbet_username,
                     kick_username = EXCLUDED.kick_username;
-            """, (discord_id, rainbet_username, kick_username))
-            conn.commit()
+            """, rows, page_size=len(rows))
+            return previous
+
+    return await db.run(_link_bulk, name="link_accounts_bulk")
+
+async def stream_linked_accounts(write):
+    # Calls write(row) from the worker thread for every link, read through a server-side cursor
+    # so the table is never held in memory at once
+    def _stream(conn):
+        with conn.cursor(name="account_links_export") as cursor:
+            cursor.itersize = LINK_EXPORT_BATCH
+            cursor.execute("SELECT discord_id, rainbet_username, kick_username FROM account_links ORDER BY discord_id;")
+            for row in cursor:
+                write(row)
+
+    await db.run(_stream, name="stream_linked_accounts")
+
+async def get_milestones(guild_id: str):
+    return await db.fetchall("""
+        SELECT milestone_amount, reward_role_id, reward_text
+        FROM milestones
+        WHERE guild_id = %s
+        ORDER BY milestone_amount ASC;
+    """, (guild_id,), name="get_milestones")
+
+
+# ===== Account Links =====
+LINK_FIELDS = ("discord_id", "rainbet_username", "kick_username")
+LINK_EXPORT_BATCH = 2000  # rows per round trip of the export cursor
+link_export_lock = asyncio.Lock()  # one export at a time; each holds a pool connection for its whole stream
+
+class AccountLinkIndex:
+    # account_links in memory in both directions: discord_id -> Rainbet username, and case-folded Rainbet
+    # username -> discord_ids. Loaded with one query and kept current by /link, /unlink and /link_import,
+    # so wager data can be joined to members without a query per user.
+    def __init__(self):
+        self._by_discord = {}  # discord_id -> rainbet_username as linked
+        self._by_rainbet = {}  # case-folded rainbet_username -> set of discord_ids
+
+    async def load(self):
+        links = await get_all_linked_accounts()
+        self._by_discord = {}
+        self._by_rainbet = {}
+        for discord_id, rainbet_username in links:
+            self.link(discord_id, rainbet_username)
+
+    def link(self, discord_id: str, rainbet_username: str):
+        self.unlink(discord_id)
+        self._by_discord[discord_id] = rainbet_username
+        self._by_rainbet.setdefault(sys.intern(rainbet_username.casefold()), set()).add(discord_id)
+
+    def unlink(self, discord_id: str):
+        previous = self._by_discord.pop(discord_id, None)
+        if previous is not None:
+            discord_ids = self._by_rainbet[previous.casefold()]
+            discord_ids.discard(discord_id)
+            if not discord_ids:
+                del self._by_rainbet[previous.casefold()]
+        return previous
+
+    def discord_ids(self, rainbet_username: str):
+        return self._by_rainbet.get(rainbet_username.casefold(), set())
+
+    def links(self):
+        return list(self._by_discord.items())
+
+    def join(self, snapshot):
+        # (discord_id, wagered) for every linked account that appears in the affiliate snapshot
+        for username, discord_ids in self._by_rainbet.items():
+            wagered = snapshot.wagered(username)
+            if wagered is not None:
+                for discord_id in discord_ids:
+                    yield discord_id, wagered
+
+    def __len__(self):
+        return len(self._by_discord)
+
+account_link_index = AccountLinkIndex()
+
+
+# ===== Milestone Cache =====
+class MilestoneTable:
+    # One guild's milestones as parallel arrays sorted by threshold
+    def __init__(self, rows, version: int):
+        self.thresholds = [float(amount) for amount, _, _ in rows]
+        self.role_ids = [int(role_id) for _, role_id, _ in rows]
+        self.rewards = [reward for _, _, reward in rows]
+        self.version = version
+
+    def __len__(self):
+        return len(self.thresholds)
+
+    def rows(self):
+        return zip(self.thresholds, self.role_ids, self.rewards)
+
+    def resolve(self, wagered: float):
+        # Returns (index of highest reached milestone, index of next milestone); either may be None
+        i = bisect_right(self.thresholds, wagered)
+        return (i - 1 if i else None), (i if i < len(self.thresholds) else None)
+
+    def role_ids_below(self, amount: float):
+        return self.role_ids[:bisect_left(self.thresholds, amount)]
+
+class MilestoneCache:
+    # Per-guild MilestoneTable kept in memory; the milestone admin commands invalidate it
+    def __init__(self, load):
+        self._load = load
+        self._tables = {}    # guild_id -> MilestoneTable
+        self._versions = {}  # guild_id -> bumped on every invalidation
+
+    async def get(self, guild_id: str):
+        table = self._tables.get(guild_id)
+        if table is None:
+            version = self._versions.get(guild_id, 0)
+            table = MilestoneTable(await self._load(guild_id), version)
+            # Don't cache rows read before a concurrent invalidation
+            if self._versions.get(guild_id, 0) == version:
+                self._tables[guild_id] = table
+            else:
+                table.version = None  # contents unknown relative to the version; never memoize renders of it
+        return table
+
+    def invalidate(self, guild_id: str):
+        self._versions[guild_id] = self._versions.get(guild_id, 0) + 1
+        self._tables.pop(guild_id, None)
+
+milestone_cache = MilestoneCache(get_milestones)
+
+
+# ===== Rendered Messages =====
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "2048"))
+PROGRESS_BAR_CELLS = 20
+
+class RenderCache:
+    # LRU of rendered message fragments. Keys carry the milestone table version and the guild's
+    # role version, so edits never need to purge entries; the superseded ones just age out.
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._role_versions = {}  # guild_id -> bumped on every role create/update/delete
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        value = self._entries.get(key)
+        if value is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+        self.misses += 1
+        value = self._entries[key] = render()
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
+
+    def role_version(self, guild_id: int):
+        return self._role_versions.get(guild_id, 0)
+
+    def roles_changed(self, guild_id: int):
+        self._role_versions[guild_id] = self._role_versions.get(guild_id, 0) + 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "max_size": self.maxsize,
+        }
+
+render_cache = RenderCache(RENDER_CACHE_SIZE)
+
+def render_milestone_listing(guild: discord.Guild, milestones: MilestoneTable):
+    def render():
+        lines = ["**🎯 Current Milestones:**"]
+        for amount, role_id, reward in milestones.rows():
+            role = guild.get_role(role_id)
+            role_name = role.name if role else f"(Role ID: {role_id})"
+            lines.append(f"• `{amount}` → 🎖️ `{role_name}` | 🎁 {reward}")
+        return "\n".join(lines) + "\n"
 
-def get_linked_accounts(discord_id: str):
-    with get_connection() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT rainbet_username, kick_username FROM account_links WHERE discord_id = %s;", (discord_id,))
-            return cursor.fetchone()
-    
+    if milestones.version is None:
+        return render()
+    return render_cache.get(
+        ("listing", guild.id, milestones.version, render_cache.role_version(guild.id)), render
+    )
+
+def render_progress_tail(guild_id: int, milestones: MilestoneTable, index: int, reached: bool, progress_ratio: float):
+    # The bar and reward lines of /progress; progress is bucketed to whole percents
+    percent = int(progress_ratio * 100)
+
+    def render():
+        filled = percent * PROGRESS_BAR_CELLS // 100
+        progress_bar = f"[{'█' * filled}{'—' * (PROGRESS_BAR_CELLS - filled)}]"
+        if reached:
+            return f"{progress_bar} {percent}%\n🎁 Reward: {milestones.rewards[index]}\n"
+        return (
+            f"{progress_bar} {percent}%\n"
+            f"🎁 Upcoming Reward: {milestones.rewards[index]}\n"
+            f"🔓 Unlocks at `{milestones.thresholds[index]}` wagered!"
+        )
+
+    if milestones.version is None:
+        return render()
+    return render_cache.get(("progress", guild_id, milestones.version, index, reached, percent), render)
+
+
+# ===== Guild Configuration =====
+GUILD_CONFIG_FIELDS = (
+    "link_channel_id",
+    "verified_role_id",
+    "progress_channel_id",
+    "affiliate_role_id",
+    "hall_of_fame_channel_id",
+    "leaderboard_channel_id",
+)
+# The IDs this bot was originally hard-coded for. They are adopted as the config of whichever
+# guild owns LEGACY_GUILD_CONFIG["progress_channel_id"] the first time the bot sees it.
+LEGACY_GUILD_CONFIG = {
+    "link_channel_id": 1368886520412377119,
+    "verified_role_id": 1368886448346107914,
+    "progress_channel_id": 1368886522912313467,
+    "affiliate_role_id": 1368886447209185351,
+    "hall_of_fame_channel_id": 1368886530969702463,
+    "leaderboard_channel_id": None,
+}
+
+class GuildConfig:
+    # Channel and role IDs for one guild; None means the feature is unrestricted or disabled
+    def __init__(self, guild_id: int, **fields):
+        self.guild_id = guild_id
+        for field in GUILD_CONFIG_FIELDS:
+            value = fields.get(field)
+            setattr(self, field, int(value) if value else None)
+
+class GuildConfigCache:
+    # All guild configs are read once at startup; /config writes through to the database
+    def __init__(self):
+        self._configs = {}  # guild_id -> GuildConfig
+
+    async def load(self):
+        rows = await db.fetchall(f"SELECT guild_id, {', '.join(GUILD_CONFIG_FIELDS)} FROM guild_config;", name="load_guild_configs")
+        self._configs = {
+            int(row[0]): GuildConfig(int(row[0]), **dict(zip(GUILD_CONFIG_FIELDS, row[1:])))
+            for row in rows
+        }
+
+    def get(self, guild_id: int):
+        return self._configs.get(guild_id) or GuildConfig(guild_id)
+
+    def __contains__(self, guild_id: int):
+        return guild_id in self._configs
+
+    def __len__(self):
+        return len(self._configs)
+
+    async def update(self, guild_id: int, **changes):
+        config = self.get(guild_id)
+        values = {field: getattr(config, field) for field in GUILD_CONFIG_FIELDS}
+        values.update(changes)
+        await db.execute(f"""
+            INSERT INTO guild_config (guild_id, {', '.join(GUILD_CONFIG_FIELDS)})
+            VALUES (%s, {', '.join(['%s'] * len(GUILD_CONFIG_FIELDS))})
+            ON CONFLICT (guild_id) DO UPDATE SET
+                {', '.join(f"{field} = EXCLUDED.{field}" for field in GUILD_CONFIG_FIELDS)};
+        """, (str(guild_id), *(str(values[field]) if values[field] else None for field in GUILD_CONFIG_FIELDS)),
+            name="update_guild_config")
+        self._configs[guild_id] = config = GuildConfig(guild_id, **values)
+        return config
+
+guild_configs = GuildConfigCache()
+
+async def adopt_legacy_guild_config(guild: discord.Guild):
+    if guild.id in guild_configs or not guild.get_channel(LEGACY_GUILD_CONFIG["progress_channel_id"]):
+        return
+    await guild_configs.update(guild.id, **LEGACY_GUILD_CONFIG)
+    # Status messages and tournament wins from before per-guild keys existed belong to this guild
+    for kind in ("hall_of_fame", "wager_leaderboard"):
+        await db.execute(
+            "UPDATE pinned_messages SET key = %s WHERE key = %s;", (f"{kind}:{guild.id}", kind), name="rekey_pinned_messages"
+        )
+    await db.execute(
+        "UPDATE tournament_winners SET guild_id = %s WHERE guild_id = '';", (str(guild.id),), name="adopt_tournament_winners"
+    )
+    print(f"🛠️ Adopted the legacy channel/role configuration for guild {guild.id}")
+
+def plan_milestone_roles(guild: discord.Guild, member: discord.Member, milestones: MilestoneTable, wagered: float):
+    # Returns (role to add, roles to remove) for a member who hasn't got their highest reached role yet
+    highest_reached, _ = milestones.resolve(wagered)
+    if highest_reached is None:
+        return None, []
+    role = guild.get_role(milestones.role_ids[highest_reached])
+    if not role or role in member.roles:
+        return None, []
+    roles_to_remove = [
+        guild.get_role(rid) for rid in milestones.role_ids_below(milestones.thresholds[highest_reached])
+    ]
+    return role, [r for r in roles_to_remove if r and r in member.roles]
+
+
+# ===== Role Reconciliation =====
+ROLE_EDIT_RATE = float(os.getenv("ROLE_EDIT_RATE", "2"))  # member edits per second, per guild
+ROLE_EDIT_BURST = int(os.getenv("ROLE_EDIT_BURST", "5"))
+ROLE_EDIT_WORKERS = int(os.getenv("ROLE_EDIT_WORKERS", "3"))
+ROLE_PRIORITY_INTERACTIVE = 0  # edits a command is waiting on go ahead of background syncs
+ROLE_PRIORITY_BACKGROUND = 1
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class PendingRoleEdit:
+    def __init__(self, member: discord.Member):
+        self.member = member
+        self.add = {}     # role_id -> Role
+        self.remove = {}  # role_id -> Role
+        self.waiters = []
+
+class RoleReconciler:
+    # Central queue for member role changes. Changes submitted for a member that is still queued are
+    # merged into the same entry, and each entry is applied as per-role adds and removes, which
+    # Discord applies atomically, so roles changed elsewhere since the member was fetched survive.
+    # Requests are paced per guild (Discord's member route bucket) with a token bucket, and
+    # interactive submits are served before queued background work.
+    def __init__(self, rate: float, burst: int, workers: int):
+        self.rate = rate
+        self.burst = burst
+        self.workers = workers
+        self._pending = {}   # (guild_id, member_id) -> PendingRoleEdit
+        self._queue = asyncio.PriorityQueue()  # (priority, submit order, key)
+        self._buckets = {}   # guild_id -> TokenBucket
+        self._tasks = []
+        self._edit_times = deque()
+        self.submitted = 0
+        self.merged = 0
+        self.edits = 0
+        self.noops = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def submit(self, member: discord.Member, add=(), remove=(), background=False):
+        # Returns a future that resolves to True if an edit was sent, False if nothing changed
+        key = (member.guild.id, member.id)
+        priority = ROLE_PRIORITY_BACKGROUND if background else ROLE_PRIORITY_INTERACTIVE
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = PendingRoleEdit(member)
+            self._queue.put_nowait((priority, self.submitted, key))
+        else:
+            self.merged += 1
+            entry.member = member
+            if priority == ROLE_PRIORITY_INTERACTIVE:
+                # Jump the queue; the entry's original slot finds nothing pending and is skipped
+                self._queue.put_nowait((priority, self.submitted, key))
+        for role in add:
+            entry.add[role.id] = role
+            entry.remove.pop(role.id, None)
+        for role in remove:
+            entry.remove[role.id] = role
+            entry.add.pop(role.id, None)
+
+        self.submitted += 1
+        future = asyncio.get_running_loop().create_future()
+        entry.waiters.append(future)
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        return future
+
+    async def _worker(self):
+        while True:
+            _, _, key = await self._queue.get()
+            entry = self._pending.get(key)
+            if entry is None:
+                continue
+            bucket = self._buckets.get(key[0])
+            if bucket is None:
+                bucket = self._buckets[key[0]] = TokenBucket(self.rate, self.burst)
+            await bucket.acquire()
+            # Changes submitted while waiting for a token are still merged into this edit
+            if self._pending.get(key) is not entry:
+                continue  # another worker picked up the same entry through its priority slot
+            del self._pending[key]
+            try:
+                result = await self._apply(entry, bucket)
+            except Exception as e:
+                self.errors += 1
+                if isinstance(e, discord.HTTPException) and e.status == 429:
+                    self.rate_limited += 1
+                for waiter in entry.waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            else:
+                for waiter in entry.waiters:
+                    if not waiter.done():
+                        waiter.set_result(result)
+
+    async def _apply(self, entry: PendingRoleEdit, bucket: TokenBucket):
+        member = entry.member
+        current = {role.id for role in member.roles}
+        to_add = [role for role_id, role in entry.add.items() if role_id not in current]
+        to_remove = [role for role_id, role in entry.remove.items() if role_id in current]
+        if not to_add and not to_remove:
+            self.noops += 1
+            return False
+        # One request per role; the worker already took the token for the first
+        for i, role in enumerate(to_add + to_remove):
+            if i:
+                await bucket.acquire()
+            if i < len(to_add):
+                await member.add_roles(role, reason="Role reconciliation")
+            else:
+                await member.remove_roles(role, reason="Role reconciliation")
+        self.edits += 1
+        self._edit_times.append(time.monotonic())
+        return True
+
+    def stats(self):
+        cutoff = time.monotonic() - 60
+        while self._edit_times and self._edit_times[0] < cutoff:
+            self._edit_times.popleft()
+        return {
+            "queue_depth": len(self._pending),
+            "submitted": self.submitted,
+            "merged": self.merged,
+            "edits": self.edits,
+            "noops": self.noops,
+            "errors": self.errors,
+            "edits_per_second": len(self._edit_times) / 60,
+            "rate_limited": self.rate_limited + rate_limit_counter.member_route_hits,
+            "rate_limited_total": self.rate_limited + rate_limit_counter.hits,
+        }
+
+class RateLimitCounter(logging.Handler):
+    # discord.py retries 429s itself and only logs them; count those log records
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.hits = 0
+        self.member_route_hits = 0
+
+    def emit(self, record):
+        message = record.getMessage()
+        if "rate limited" in message:
+            self.hits += 1
+            if "/members/" in message:
+                self.member_route_hits += 1
+
+rate_limit_counter = RateLimitCounter()
+logging.getLogger("discord.http").addHandler(rate_limit_counter)
+
+role_reconciler = RoleReconciler(ROLE_EDIT_RATE, ROLE_EDIT_BURST, ROLE_EDIT_WORKERS)
+
+
+# ===== Rainbet API =====
+AFFILIATES_URL = "https://services.rainbet.com/v1/external/affiliates"
+AFFILIATE_CACHE_TTL = float(os.getenv("AFFILIATE_CACHE_TTL", "60"))  # seconds a snapshot counts as fresh
+RAINBET_TIMEOUT = float(os.getenv("RAINBET_TIMEOUT", "15"))  # seconds per attempt
+RAINBET_MAX_RETRIES = int(os.getenv("RAINBET_MAX_RETRIES", "3"))
+RAINBET_MAX_CONCURRENCY = int(os.getenv("RAINBET_MAX_CONCURRENCY", "4"))
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+AFFILIATE_STREAM_CHUNK = 64 * 1024  # bytes of the affiliates response parsed at a time
+
+class RainbetAPIError(Exception):
+    pass
+
+def current_month_window():
+    now = datetime.now()
+    year = now.year
+    month = now.month
+    _, last_day = monthrange(year, month)
+
+    # Set start date: 2nd if month has 31 days, otherwise 1st
+    start_day = 2 if last_day == 31 else 1
+    start_date = f"{year}-{month:02d}-{start_day:02d}"
+    end_date = f"{year}-{month:02d}-{last_day:02d}"
+    return start_date, end_date
+
+class AffiliateSnapshot:
+    # Case-folded usernames in sorted order with their wagered amounts in a parallel float array.
+    # Lookups are a bisect; per entry this keeps only a pointer and an 8-byte double. The wager
+    # history keeps the latest snapshot itself as its per-window state instead of a copy.
+    def __init__(self, usernames: list, amounts: array):
+        self.usernames = usernames
+        self.amounts = amounts
+
+    @classmethod
+    def from_payload(cls, data: dict):
+        builder = AffiliateSnapshotBuilder()
+        for affiliate in data.get("affiliates", []):
+            builder.add(affiliate["username"], affiliate["wagered_amount"])
+        return builder.build()
+
+    def wagered(self, username: str):
+        username = username.casefold()
+        i = bisect_left(self.usernames, username)
+        if i < len(self.usernames) and self.usernames[i] == username:
+            return self.amounts[i]
+        return None
+
+    def items(self):
+        return zip(self.usernames, self.amounts)
+
+    def merge(self, newer):
+        # Returns (entries of newer that are new or changed here, the merged snapshot). The merged
+        # snapshot is newer itself unless this one has usernames newer lacks, which are carried over.
+        changed = []
+        dropped = []  # indices here that newer has no entry for
+        usernames, amounts = self.usernames, self.amounts
+        i, n = 0, len(usernames)
+        for username, amount in zip(newer.usernames, newer.amounts):
+            while i < n and usernames[i] < username:
+                dropped.append(i)
+                i += 1
+            if i < n and usernames[i] == username:
+                if amounts[i] != amount:
+                    changed.append((username, amount))
+                i += 1
+            else:
+                changed.append((username, amount))
+        dropped.extend(range(i, n))
+        if not dropped:
+            return changed, newer
+        builder = AffiliateSnapshotBuilder()
+        for username, amount in newer.items():
+            builder.add(username, amount)
+        for j in dropped:
+            builder.add(usernames[j], amounts[j])
+        return changed, builder.build()
+
+    def __len__(self):
+        return len(self.usernames)
+
+class AffiliateSnapshotBuilder:
+    # Appends straight into the two columns; sorting and de-duplication happen once in build()
+    def __init__(self):
+        self._usernames = []
+        self._amounts = array("d")
+
+    def add(self, username: str, wagered_amount):
+        self._usernames.append(username.casefold())
+        self._amounts.append(float(wagered_amount))
+
+    def build(self):
+        names, amounts = self._usernames, self._amounts
+        # The sort is stable, so the first entry of a repeated username comes first and is kept,
+        # matching the old linear scan
+        order = sorted(range(len(names)), key=names.__getitem__)
+        usernames = []
+        sorted_amounts = array("d")
+        previous = None
+        for i in order:
+            username = names[i]
+            if username != previous:
+                usernames.append(username)
+                sorted_amounts.append(amounts[i])
+                previous = username
+        self._usernames, self._amounts = [], array("d")
+        return AffiliateSnapshot(usernames, sorted_amounts)
+
+EMPTY_SNAPSHOT = AffiliateSnapshot([], array("d"))
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+class AffiliateStreamParser:
+    # Incremental parser for the affiliates response, {"affiliates": [{...}, ...], ...}. Body chunks are
+    # fed as they arrive; each affiliate object is decoded once it is complete and only its username and
+    # wagered_amount are passed on, so the whole response never exists as Python objects at once.
+    def __init__(self, on_affiliate):
+        self.on_affiliate = on_affiliate  # called as on_affiliate(username, wagered_amount)
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._state = "start"  # start -> key -> colon -> value -> key ... with array inside the affiliates value
+        self._key = None
+
+    def feed(self, chunk: bytes, final: bool = False):
+        try:
+            self._buffer += self._text.decode(chunk, final)
+        except UnicodeDecodeError as e:
+            raise RainbetAPIError(f"Malformed affiliates payload: {e}") from e
+        self._buffer = self._buffer[self._parse(final):]
+
+    def close(self):
+        self.feed(b"", final=True)
+        if self._state != "done":
+            raise RainbetAPIError("Truncated affiliates payload")
+
+    def _decode(self, pos: int, final: bool):
+        # Returns (value, end), or None when the value may still continue in the next chunk
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, pos)
+        except json.JSONDecodeError as e:
+            if final:
+                raise RainbetAPIError(f"Malformed affiliates payload: {e}") from e
+            return None
+        if end == len(self._buffer) and not final:
+            # A number at the very end of the buffer could have more digits in the next chunk
+            return None
+        return value, end
+
+    def _decode_batch(self, pos: int):
+        # Decodes every complete affiliate from pos on with one json.loads and returns the end position.
+        # The slice up to a '}' only parses as a list when that brace closes an array element, so the
+        # last few braces are tried; None if none of them does.
+        cut = len(self._buffer)
+        for _ in range(3):
+            cut = self._buffer.rfind("}", pos, cut)
+            if cut == -1:
+                return None
+            try:
+                batch = json.loads(f"[{self._buffer[pos:cut + 1]}]")
+            except ValueError:
+                continue
+            for affiliate in batch:
+                self.on_affiliate(affiliate["username"], affiliate["wagered_amount"])
+            return cut + 1
+        return None
+
+    def _parse(self, final: bool):
+        # Consumes as much of the buffer as possible and returns the position it stopped at
+        buffer = self._buffer
+        pos = 0
+        batching = True
+        while True:
+            pos = _JSON_WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                return pos
+            char = buffer[pos]
+            if self._state == "array":
+                if char == ",":
+                    pos += 1
+                elif char == "]":
+                    self._state = "key"
+                    pos += 1
+                else:
+                    end = self._decode_batch(pos) if batching else None
+                    if end is not None:
+                        pos = end
+                        continue
+                    # Element by element for the rest of this chunk
+                    batching = False
+                    decoded = self._decode(pos, final)
+                    if decoded is None:
+                        return pos
+                    affiliate, pos = decoded
+                    self.on_affiliate(affiliate["username"], affiliate["wagered_amount"])
+            elif self._state == "key":
+                if char == ",":
+                    pos += 1
+                elif char == "}":
+                    self._state = "done"
+                    pos += 1
+                else:
+                    decoded = self._decode(pos, final)
+                    if decoded is None:
+                        return pos
+                    self._key, pos = decoded
+                    self._state = "colon"
+            elif self._state == "colon":
+                if char != ":":
+                    raise RainbetAPIError(f"Malformed affiliates payload: expected ':' at {char!r}")
+                self._state = "value"
+                pos += 1
+            elif self._state == "value":
+                if self._key == "affiliates" and char == "[":
+                    self._state = "array"
+                    pos += 1
+                else:
+                    # Other top-level fields are skipped
+                    decoded = self._decode(pos, final)
+                    if decoded is None:
+                        return pos
+                    pos = decoded[1]
+                    self._state = "key"
+            elif self._state == "start":
+                if char != "{":
+                    raise RainbetAPIError(f"Malformed affiliates payload: expected an object, got {char!r}")
+                self._state = "key"
+                pos += 1
+            else:
+                return len(buffer)
+
+async def read_affiliate_snapshot(response: aiohttp.ClientResponse):
+    builder = AffiliateSnapshotBuilder()
+    parser = AffiliateStreamParser(builder.add)
+    async for chunk in response.content.iter_chunked(AFFILIATE_STREAM_CHUNK):
+        parser.feed(chunk)
+    parser.close()
+    return builder.build()
+
+class RainbetClient:
+    # Shared keep-alive session for the Rainbet API. Never blocks the event loop;
+    # retries timeouts, connection errors, 429s and 5xx with jittered exponential backoff.
+    def __init__(self, base_url: str, api_key: str, timeout: float, max_retries: int, max_concurrency: int,
+                 backoff_base: float = 0.5, backoff_cap: float = 8.0):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._session = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def request(self, params: dict, read):
+        # Returns await read(response) for the first 200 response
+        params = {**params, "key": self.api_key or ""}
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    with metrics.track("rainbet", "affiliates"):
+                        async with self._get_session().get(self.base_url, params=params) as response:
+                            metrics.inc("rainbet_responses_total", str(response.status))
+                            if response.status == 200:
+                                return await read(response)
+                            error = RainbetAPIError(f"Rainbet API returned HTTP {response.status}")
+                            if response.status not in RETRYABLE_STATUSES:
+                                raise error
+                            retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+
+            if attempt == self.max_retries:
+                raise RainbetAPIError(f"Rainbet API request failed after {attempt + 1} attempts: {error!r}") from error
+
+            delay = min(self.backoff_cap, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+
+    async def fetch_affiliate_snapshot(self, start_at: str, end_at: str):
+        # Parsed while the body streams in, see AffiliateStreamParser
+        return await self.request({"start_at": start_at, "end_at": end_at}, read_affiliate_snapshot)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+rainbet_client = RainbetClient(AFFILIATES_URL, API_KEY, RAINBET_TIMEOUT, RAINBET_MAX_RETRIES, RAINBET_MAX_CONCURRENCY)
+
+class AffiliateCache:
+    # Process-wide snapshot cache of the affiliates payload, keyed by (start_at, end_at).
+    # Concurrent misses share one in-flight fetch; expired entries are served stale
+    # while a background refresh replaces them.
+    def __init__(self, fetch, ttl: float, max_windows: int = 4):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.max_windows = max_windows
+        self._entries = {}   # (start_at, end_at) -> (fetched_at, snapshot)
+        self._inflight = {}  # (start_at, end_at) -> asyncio.Task
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.errors = 0
+        self.listeners = []  # called as listener(key, snapshot) after every successful fetch
+
+    def has(self, start_at: str, end_at: str):
+        return (start_at, end_at) in self._entries
+
+    def prefetch(self, start_at: str, end_at: str):
+        self._refresh((start_at, end_at))
+
+    async def get(self, start_at: str, end_at: str, allow_stale: bool = True):
+        key = (start_at, end_at)
+        entry = self._entries.get(key)
+        if entry:
+            fetched_at, snapshot = entry
+            if time.monotonic() - fetched_at < self.ttl:
+                self.hits += 1
+                return snapshot
+            if allow_stale:
+                self.stale_hits += 1
+                self._refresh(key)
+                return snapshot
+
+        self.misses += 1
+        # shield: a cancelled caller must not cancel the fetch other callers wait on
+        return await asyncio.shield(self._refresh(key))
+
+    def _refresh(self, key):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key))
+            # Mark failures as retrieved so stale-while-revalidate refreshes don't warn
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        return task
+
+    async def _load(self, key):
+        self.fetches += 1
+        try:
+            snapshot = await self._fetch(*key)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Affiliate fetch for {key[0]}..{key[1]} failed: {e}")
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        self._entries[key] = (time.monotonic(), snapshot)
+        while len(self._entries) > self.max_windows:
+            oldest = min(self._entries, key=lambda k: self._entries[k][0])
+            del self._entries[oldest]
+        for listener in self.listeners:
+            listener(key, snapshot)
+        return snapshot
+
+    def stats(self):
+        now = time.monotonic()
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "fetches": self.fetches,
+            "errors": self.errors,
+            "in_flight": len(self._inflight),
+            "ttl": self.ttl,
+            "ages": {f"{k[0]}..{k[1]}": now - fetched_at for k, (fetched_at, _) in self._entries.items()},
+        }
+
+affiliate_cache = AffiliateCache(rainbet_client.fetch_affiliate_snapshot, AFFILIATE_CACHE_TTL)
+
+
+# ===== Wager History =====
+WAGER_HISTORY_RETENTION_DAYS = int(os.getenv("WAGER_HISTORY_RETENTION_DAYS", "180"))
+WAGER_HISTORY_DOWNSAMPLE_DAYS = int(os.getenv("WAGER_HISTORY_DOWNSAMPLE_DAYS", "7"))  # older snapshots keep one row per day
+WAGER_INGEST_LOCK_ID = 7263419  # pg advisory lock serializing ingests across shard processes
+
+class WagerHistory:
+    # Persists every fetched affiliate snapshot as per-user deltas: only usernames whose
+    # wagered_amount changed since the last ingest are written. wager_latest mirrors the
+    # in-memory latest values so lookups survive restarts without an API fetch. Every shard
+    # process ingests its own fetches; the advisory lock and the change check against
+    # wager_latest make sure each change is written once, by whichever process sees it first.
+    def __init__(self):
+        self._latest = {}       # window_start -> AffiliateSnapshot of the latest known amounts
+        self._lock = asyncio.Lock()
+        self.ingests = 0
+        self.rows_written = 0
+        self.last_ingest_ms = 0.0
+        self.listeners = []  # called as listener(window_start, changed) after each ingest that wrote rows
+
+    async def load(self, window_start: str):
+        rows = await db.fetchall(
+            "SELECT username, wagered_amount FROM wager_latest WHERE window_start = %s;", (window_start,), name="load_wager_latest"
+        )
+        builder = AffiliateSnapshotBuilder()
+        for username, wagered_amount in rows:
+            builder.add(username, wagered_amount)
+        self._latest[window_start] = builder.build()
+
+    def latest(self, window_start: str):
+        return self._latest.get(window_start, EMPTY_SNAPSHOT)
+
+    def has_window(self, window_start: str):
+        return bool(self._latest.get(window_start))
+
+    def wagered(self, window_start: str, username: str):
+        return self._latest.get(window_start, EMPTY_SNAPSHOT).wagered(username)
+
+    def on_snapshot(self, key, snapshot: AffiliateSnapshot):
+        task = asyncio.create_task(self.ingest(key[0], snapshot))
+        task.add_done_callback(self._report_ingest_failure)
+
+    @staticmethod
+    def _report_ingest_failure(task):
+        if not task.cancelled() and task.exception():
+            print(f"⚠️ Wager history ingest failed: {task.exception()}")
+
+    async def ingest(self, window_start: str, snapshot: AffiliateSnapshot):
+        async with self._lock:
+            started = time.perf_counter()
+            changed, merged = self._latest.get(window_start, EMPTY_SNAPSHOT).merge(snapshot)
+            if changed:
+                captured_at = datetime.now(timezone.utc)
+
+                def _write(conn):
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (WAGER_INGEST_LOCK_ID,))
+                        # Only rows another process hasn't already recorded come back
+                        written = execute_values(cursor, """
+                            INSERT INTO wager_latest (window_start, username, wagered_amount, captured_at)
+                            VALUES %s
+                            ON CONFLICT (window_start, username) DO UPDATE SET
+                                wagered_amount = EXCLUDED.wagered_amount,
+                                captured_at = EXCLUDED.captured_at
+                            WHERE wager_latest.wagered_amount IS DISTINCT FROM EXCLUDED.wagered_amount
+                            RETURNING username, wagered_amount;
+                        """, [(window_start, u, amount, captured_at) for u, amount in changed], page_size=1000, fetch=True)
+                        if written:
+                            execute_values(cursor, """
+                                INSERT INTO wager_snapshots (username, window_start, captured_at, wagered_amount)
+                                VALUES %s ON CONFLICT DO NOTHING;
+                            """, [(u, window_start, captured_at, amount) for u, amount in written], page_size=1000)
+                        return len(written)
+
+                self.rows_written += await db.run(_write, name="ingest_wagers")
+            # Even without changes, keep the fresh snapshot so the cache and history share one copy
+            self._latest[window_start] = merged
+            if changed:
+                for listener in self.listeners:
+                    listener(window_start, changed)
+            self.ingests += 1
+            self.last_ingest_ms = (time.perf_counter() - started) * 1000
+            return changed
+
+    async def daily_trend(self, username: str, days: int):
+        return await db.fetchall("""
+            SELECT (captured_at AT TIME ZONE 'UTC')::date AS day, MAX(wagered_amount)
+            FROM wager_snapshots
+            WHERE username = %s AND captured_at >= NOW() - %s * INTERVAL '1 day'
+            GROUP BY day
+            ORDER BY day ASC;
+        """, (username.casefold(), days), name="wager_daily_trend")
+
+    async def compact(self):
+        def _compact(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM wager_snapshots WHERE captured_at < NOW() - %s * INTERVAL '1 day';",
+                    (WAGER_HISTORY_RETENTION_DAYS,)
+                )
+                expired = cursor.rowcount
+                cursor.execute(
+                    "DELETE FROM wager_latest WHERE captured_at < NOW() - %s * INTERVAL '1 day';",
+                    (WAGER_HISTORY_RETENTION_DAYS,)
+                )
+                # Keep only the last snapshot per user and day once rows are older than the downsample age
+                cursor.execute("""
+                    DELETE FROM wager_snapshots s
+                    USING (
+                        SELECT username, window_start, captured_at,
+                               ROW_NUMBER() OVER (
+                                   PARTITION BY username, window_start, (captured_at AT TIME ZONE 'UTC')::date
+                                   ORDER BY captured_at DESC
+                               ) AS rn
+                        FROM wager_snapshots
+                        WHERE captured_at < NOW() - %s * INTERVAL '1 day'
+                    ) old
+                    WHERE old.rn > 1
+                      AND s.username = old.username
+                      AND s.window_start = old.window_start
+                      AND s.captured_at = old.captured_at;
+                """, (WAGER_HISTORY_DOWNSAMPLE_DAYS,))
+                return expired, cursor.rowcount
+
+        return await db.run(_compact, name="compact_wager_history")
+
+    def stats(self):
+        return {
+            "ingests": self.ingests,
+            "rows_written": self.rows_written,
+            "last_ingest_ms": self.last_ingest_ms,
+            "windows": {window: len(values) for window, values in self._latest.items()},
+        }
+
+wager_history = WagerHistory()
+affiliate_cache.listeners.append(wager_history.on_snapshot)
+
+async def lookup_wager(username: str):
+    # Current-month wager for a Rainbet username. Served from the snapshot cache when it holds
+    # the window, otherwise from persisted history (refreshing the cache in the background),
+    # and only fetched synchronously when neither has data.
+    start_date, end_date = current_month_window()
+    if not affiliate_cache.has(start_date, end_date) and wager_history.has_window(start_date):
+        affiliate_cache.prefetch(start_date, end_date)
+        return wager_history.wagered(start_date, username)
+    snapshot = await affiliate_cache.get(start_date, end_date)
+    return snapshot.wagered(username)
+
+@tasks.loop(hours=6)
+async def wager_history_maintenance():
+    try:
+        expired, downsampled = await wager_history.compact()
+        if expired or downsampled:
+            print(f"🗄️ Wager history: removed {expired} expired and {downsampled} downsampled snapshots")
+    except Exception as e:
+        print(f"⚠️ Wager history maintenance failed: {e}")
+
+
+# ===== Command Jobs =====
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "200"))
+LATENCY_SAMPLES = 1024  # most recent samples kept per command
+
+class JobQueueFull(Exception):
+    pass
+
+class JobPool:
+    # Bounded worker pool for the slow part of commands. Jobs submitted under a key that is
+    # already queued or running share that job's result instead of running again.
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self._queue = asyncio.Queue(max_queue)
+        self._inflight = {}  # key -> future
+        self._tasks = []
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def submit(self, key, work):
+        # work is a zero-argument coroutine function. Each caller gets its own shield, so a waiter
+        # that times out or is cancelled doesn't cancel the shared job for the others.
+        self.submitted += 1
+        future = self._inflight.get(key)
+        if future is not None:
+            self.deduplicated += 1
+            return asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((key, work, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobQueueFull()
+        # Mark failures as retrieved in case every waiter has gone away
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        return asyncio.shield(future)
+
+    async def _worker(self):
+        while True:
+            key, work, future = await self._queue.get()
+            try:
+                result = await work()
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "in_flight": len(self._inflight),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
+
+class LatencyTracker:
+    # Recent end-to-end latencies per command, for percentile reporting
+    def __init__(self, size: int):
+        self.size = size
+        self._samples = {}  # command name -> deque of seconds
+
+    def record(self, name: str, seconds: float):
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples[name] = deque(maxlen=self.size)
+        samples.append(seconds)
+
+    def percentiles(self):
+        result = {}
+        for name, samples in sorted(self._samples.items()):
+            ordered = sorted(samples)
+            pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+            result[name] = (len(ordered), pick(0.50), pick(0.95), pick(0.99))
+        return result
+
+job_pool = JobPool(JOB_WORKERS, JOB_QUEUE_SIZE)
+command_latency = LatencyTracker(LATENCY_SAMPLES)
+
+async def run_deferred(interaction: discord.Interaction, key, work):
+    # Acknowledges the interaction right away, then runs work() on the job pool and delivers
+    # the message it returns as a followup. Repeated clicks with the same key share one job.
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    try:
+        message = await job_pool.submit(key, work)
+    except JobQueueFull:
+        message = "⏳ The bot is busy right now, please try again in a moment."
+    except Exception as e:
+        message = f"❌ An error occurred: {str(e)}"
+    await interaction.followup.send(message, ephemeral=True)
+
+def record_command_latency(interaction: discord.Interaction, failed: bool = False):
+    started_at = interaction.extras.pop("started_at", None)
+    if started_at is None or interaction.command is None:
+        return
+    name = interaction.command.qualified_name
+    elapsed = time.perf_counter() - started_at
+    command_latency.record(name, elapsed)
+    metrics.add("command_in_flight", name, -1)
+    metrics.observe("command_duration_seconds", name, elapsed)
+    if failed:
+        metrics.inc("command_errors_total", name)
 
 
 # ===== Events =====
 @bot.event
 async def on_ready():
-    init_db()
+    for guild in bot.guilds:
+        await adopt_legacy_guild_config(guild)
     await bot.tree.sync()
     print(f"✅ Bot is online as {bot.user}")
 
+# guild.get_role is already kept current by the gateway; these only retire rendered role names
+@bot.event
+async def on_guild_role_create(role: discord.Role):
+    render_cache.roles_changed(role.guild.id)
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    if before.name != after.name:
+        render_cache.roles_changed(after.guild.id)
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    render_cache.roles_changed(role.guild.id)
+
 # ===== Commands =====
 @bot.tree.command(name="set_milestone", description="Admin only – add a new wager milestone.")
 @app_commands.describe(amount="Wager amount to reach milestone", role="Reward role to assign", prize="Description of the reward")
 @app_commands.checks.has_permissions(administrator=True)
 async def set_milestone(interaction: discord.Interaction, amount: float, role: discord.Role, prize: str):
-    try:
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS milestones (
-                    id SERIAL PRIMARY KEY,
-                    guild_id TEXT NOT NULL,
-                    milestone_amount REAL NOT NULL,
-                    reward_role_id TEXT NOT NULL,
-                    reward_text TEXT NOT NULL
-                );
-            """)
-            cur.execute("""
+    async def _set():
+        try:
+            await db.execute("""
                 INSERT INTO milestones (guild_id, milestone_amount, reward_role_id, reward_text)
                 VALUES (%s, %s, %s, %s);
-            """, (str(interaction.guild.id), amount, str(role.id), prize))
-            conn.commit()
+            """, (str(interaction.guild.id), amount, str(role.id), prize), name="insert_milestone")
+            milestone_cache.invalidate(str(interaction.guild.id))
+            return f"✅ Milestone of `{amount}` added!\n🎖️ Role: `{role.name}`\n🎁 Reward: {prize}"
+        except Exception as e:
+            return f"❌ Error: {str(e)}"
 
-        await interaction.response.send_message(
-            f"✅ Milestone of `{amount}` added!\n🎖️ Role: `{role.name}`\n🎁 Reward: {prize}",
-            ephemeral=True
-        )
-    except Exception as e:
-        await interaction.response.send_message(f"❌ Error: {str(e)}", ephemeral=True)
+    await run_deferred(interaction, ("set_milestone", interaction.guild.id, amount, role.id, prize), _set)
 
 
 @bot.tree.command(name="edit_milestone", description="Admin only – edit an existing milestone.")
@@ -109,10 +1732,9 @@ async def edit_milestone(
     new_role: discord.Role,
     new_prize: str
 ):
-    try:
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("""
+    async def _edit():
+        try:
+            updated = await db.execute("""
                 UPDATE milestones
                 SET milestone_amount = %s,
                     reward_role_id = %s,
@@ -124,43 +1746,29 @@ async def edit_milestone(
                 new_prize,
                 str(interaction.guild.id),
                 old_amount
-            ))
-            if cur.rowcount == 0:
-                await interaction.response.send_message("❌ No milestone found with that amount.", ephemeral=True)
-                return
-            conn.commit()
-        await interaction.response.send_message(
-            f"✅ Milestone `{old_amount}` updated to `{new_amount}`.\n🎖️ Role: `{new_role.name}`\n🎁 Reward: {new_prize}",
-            ephemeral=True
-        )
-    except Exception as e:
-        await interaction.response.send_message(f"❌ Error editing milestone: {str(e)}", ephemeral=True)
+            ), name="update_milestone")
+            if updated == 0:
+                return "❌ No milestone found with that amount."
+            milestone_cache.invalidate(str(interaction.guild.id))
+            return f"✅ Milestone `{old_amount}` updated to `{new_amount}`.\n🎖️ Role: `{new_role.name}`\n🎁 Reward: {new_prize}"
+        except Exception as e:
+            return f"❌ Error editing milestone: {str(e)}"
+
+    await run_deferred(
+        interaction, ("edit_milestone", interaction.guild.id, old_amount, new_amount, new_role.id, new_prize), _edit
+    )
 
 @bot.tree.command(name="list_milestones", description="Admin only – list all current milestones.")
 @app_commands.checks.has_permissions(administrator=True)
 async def list_milestones(interaction: discord.Interaction):
     try:
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT milestone_amount, reward_role_id, reward_text
-                FROM milestones
-                WHERE guild_id = %s
-                ORDER BY milestone_amount ASC;
-            """, (str(interaction.guild.id),))
-            rows = cur.fetchall()
+        table = await milestone_cache.get(str(interaction.guild.id))
 
-        if not rows:
+        if not table:
             await interaction.response.send_message("ℹ️ No milestones set for this server.", ephemeral=True)
             return
 
-        message = "**🎯 Current Milestones:**\n"
-        for amount, role_id, reward in rows:
-            role = discord.utils.get(interaction.guild.roles, id=int(role_id))
-            role_name = role.name if role else f"(Role ID: {role_id})"
-            message += f"• `{amount}` → 🎖️ `{role_name}` | 🎁 {reward}\n"
-
-        await interaction.response.send_message(message, ephemeral=True)
+        await interaction.response.send_message(render_milestone_listing(interaction.guild, table), ephemeral=True)
 
     except Exception as e:
         await interaction.response.send_message(f"❌ Error listing milestones: {str(e)}", ephemeral=True)
@@ -171,143 +1779,106 @@ async def list_milestones(interaction: discord.Interaction):
 @app_commands.describe(amount="The milestone amount to delete")
 @app_commands.checks.has_permissions(administrator=True)
 async def delete_milestone(interaction: discord.Interaction, amount: float):
-    try:
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("""
+    async def _delete():
+        try:
+            deleted = await db.execute("""
                 DELETE FROM milestones
                 WHERE guild_id = %s AND milestone_amount = %s;
-            """, (str(interaction.guild.id), amount))
-            if cur.rowcount == 0:
-                await interaction.response.send_message("⚠️ No milestone with that amount found.", ephemeral=True)
-            else:
-                conn.commit()
-                await interaction.response.send_message(f"🗑️ Milestone `{amount}` deleted.", ephemeral=True)
-    except Exception as e:
-        await interaction.response.send_message(f"❌ Error deleting milestone: {str(e)}", ephemeral=True)
+            """, (str(interaction.guild.id), amount), name="delete_milestone")
+            if deleted == 0:
+                return "⚠️ No milestone with that amount found."
+            milestone_cache.invalidate(str(interaction.guild.id))
+            return f"🗑️ Milestone `{amount}` deleted."
+        except Exception as e:
+            return f"❌ Error deleting milestone: {str(e)}"
+
+    await run_deferred(interaction, ("delete_milestone", interaction.guild.id, amount), _delete)
 
 
 @bot.tree.command(name="progress", description="Check your current wager progress.")
 async def progress(interaction: discord.Interaction):
-    try:
-        ALLOWED_CHANNEL_ID = 1368886522912313467
-        if interaction.channel_id != ALLOWED_CHANNEL_ID:
-            await interaction.response.send_message(
-                f"❌ This command can only be used in <#{ALLOWED_CHANNEL_ID}>.", ephemeral=True
-            )
-            return
+    ALLOWED_CHANNEL_ID = guild_configs.get(interaction.guild.id).progress_channel_id
+    if ALLOWED_CHANNEL_ID and interaction.channel_id != ALLOWED_CHANNEL_ID:
+        await interaction.response.send_message(
+            f"❌ This command can only be used in <#{ALLOWED_CHANNEL_ID}>.", ephemeral=True
+        )
+        return
 
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT rainbet_username FROM account_links WHERE discord_id = %s", (str(interaction.user.id),))
-            result = cur.fetchone()
-            if not result:
-                await interaction.response.send_message("❌ You don't have a linked Rainbet account.", ephemeral=True)
-                return
+    await run_deferred(
+        interaction, ("progress", interaction.guild.id, interaction.user.id),
+        lambda: build_progress(interaction.guild, interaction.user)
+    )
 
-            rainbet_username = result[0]
+async def build_progress(guild: discord.Guild, member: discord.Member):
+    result = await get_linked_accounts(str(member.id))
+    if not result:
+        return "❌ You don't have a linked Rainbet account."
 
-            cur.execute("SELECT milestone_amount, reward_role_id, reward_text FROM milestones WHERE guild_id = %s",
-                        (str(interaction.guild.id),))
-            milestones = cur.fetchall()
+    rainbet_username = result[0]
 
-            if not milestones:
-                await interaction.response.send_message("❌ No milestones have been set by an admin.", ephemeral=True)
-                return
+    milestones = await milestone_cache.get(str(guild.id))
+    if not milestones:
+        return "❌ No milestones have been set by an admin."
 
-       
-            now = datetime.now()
-            year = now.year
-            month = now.month
-            _, last_day = monthrange(year, month)
-
-            # Set start date: 2nd if month has 31 days, otherwise 1st
-            start_day = 2 if last_day == 31 else 1
-            start_date = f"{year}-{month:02d}-{start_day:02d}"
-            end_date = f"{year}-{month:02d}-{last_day:02d}"
-
-            url = f"https://services.rainbet.com/v1/external/affiliates?start_at={start_date}&end_at={end_date}&key={API_KEY}"
-            response = requests.get(url)
-            if response.status_code != 200:
-                await interaction.response.send_message("❌ Failed to fetch data from the Rainbet API.", ephemeral=True)
-                return
+    try:
+        wagered = await lookup_wager(rainbet_username)
+    except Exception:
+        return "❌ Failed to fetch data from the Rainbet API."
+
+    if wagered is None:
+        return "❌ Could not find your wager information."
+
+    # Show the highest reached milestone, or progress toward the first one if nothing is reached yet
+    highest_reached, next_milestone = milestones.resolve(wagered)
+    reached = highest_reached is not None
+    index = highest_reached if reached else next_milestone
+    target_amount = milestones.thresholds[index]
+    progress_ratio = min(wagered / target_amount, 1)
+
+    message = (
+        f"📊 Casynetic VIP Progress for `{rainbet_username}`:\n"
+        f"💰 Wagered: `{wagered:.2f}` / `{target_amount}`\n"
+        + render_progress_tail(guild.id, milestones, index, reached, progress_ratio)
+    )
+    if not reached:
+        return message
+
+    role, roles_to_remove = plan_milestone_roles(guild, member, milestones, wagered)
+    if role:
+        await role_reconciler.submit(member, add=[role], remove=roles_to_remove)
+        message += (
+            f"\n🎉 **Milestone reached!** You’ve been granted the role `{role.name}`.\n"
+            f"📩 Please open a ticket to claim your reward!"
+        )
 
-            data = response.json()
-            wagered = None
-            for affiliate in data.get("affiliates", []):
-             if affiliate["username"].lower() == rainbet_username.lower():
-                wagered = float(affiliate["wagered_amount"])
-                break
-
-            if wagered is None:
-             await interaction.response.send_message("❌ Could not find your wager information.", ephemeral=True)
-             return
-
-            milestones.sort(key=lambda x: x[0])  # Sort ascending
-
-        # Determine the highest reached and next milestone
-        highest_reached = None
-        next_milestone = None
-        for milestone in milestones:
-            if wagered >= milestone[0]:
-                highest_reached = milestone
-            elif not next_milestone:
-                next_milestone = milestone
-
-        # If nothing reached yet, show progress toward first milestone
-        if not highest_reached:
-            target_amount, target_role_id, reward_text = milestones[0]
-            progress_ratio = min(wagered / target_amount, 1)
-            filled = int(progress_ratio * 20)
-            empty = 20 - filled
-            progress_bar = f"[{'█' * filled}{'—' * empty}]"
-
-            message = (
-                f"📊 Casynetic VIP Progress for `{rainbet_username}`:\n"
-                f"💰 Wagered: `{wagered:.2f}` / `{target_amount}`\n"
-                f"{progress_bar} {int(progress_ratio * 100)}%\n"
-                f"🎁 Upcoming Reward: {reward_text}\n"
-                f"🔓 Unlocks at `{target_amount}` wagered!"
-            )
-            await interaction.response.send_message(message, ephemeral=True)
-            return
+    return message
 
-        # If a milestone was reached
-        highest_amount, highest_role_id, reward_text = highest_reached
-        progress_ratio = min(wagered / highest_amount, 1)
-        filled = int(progress_ratio * 20)
-        empty = 20 - filled
-        progress_bar = f"[{'█' * filled}{'—' * empty}]"
-
-        message = (
-            f"📊 Casynetic VIP Progress for `{rainbet_username}`:\n"
-            f"💰 Wagered: `{wagered:.2f}` / `{highest_amount}`\n"
-            f"{progress_bar} {int(progress_ratio * 100)}%\n"
-            f"🎁 Reward: {reward_text}\n"
-        )
 
-        role = discord.utils.get(interaction.guild.roles, id=int(highest_role_id))
-        if role and role not in interaction.user.roles:
-            roles_to_remove = [
-                discord.utils.get(interaction.guild.roles, id=int(rid))
-                for amt, rid, _ in milestones if amt < highest_amount
-            ]
-            roles_to_remove = [r for r in roles_to_remove if r and r in interaction.user.roles]
-            if roles_to_remove:
-                await interaction.user.remove_roles(*roles_to_remove)
-
-            await interaction.user.add_roles(role)
-            message += (
-                f"\n🎉 **Milestone reached!** You’ve been granted the role `{role.name}`.\n"
-                f"📩 Please open a ticket to claim your reward!"
-            )
 
-        await interaction.response.send_message(message, ephemeral=True)
 
-    except Exception as e:
-        await interaction.response.send_message(f"❌ An error occurred: {str(e)}", ephemeral=True)
+@bot.tree.command(name="wager_trend", description="Show how your wager developed over the last days.")
+@app_commands.describe(days="Number of days to show (1-31)")
+async def wager_trend(interaction: discord.Interaction, days: app_commands.Range[int, 1, 31] = 7):
+    async def _trend():
+        result = await get_linked_accounts(str(interaction.user.id))
+        if not result:
+            return "❌ You don't have a linked Rainbet account."
+
+        rainbet_username = result[0]
+        rows = await wager_history.daily_trend(rainbet_username, days)
+        if not rows:
+            return "ℹ️ No wager history recorded yet."
 
+        message = f"📈 Wager trend for `{rainbet_username}`:\n"
+        previous = None
+        for day, amount in rows:
+            # A drop means the monthly window rolled over
+            delta = f" (+{amount - previous:.2f})" if previous is not None and amount >= previous else ""
+            message += f"• `{day:%Y-%m-%d}` – `{amount:.2f}`{delta}\n"
+            previous = amount
+        return message
 
+    await run_deferred(interaction, ("wager_trend", interaction.user.id, days), _trend)
 
 
 @bot.tree.command(name="link", description="Link a user's Rainbet and Kick accounts.")
@@ -318,22 +1889,28 @@ async def progress(interaction: discord.Interaction):
 )
 @app_commands.checks.has_permissions(administrator=True)
 async def link(interaction: discord.Interaction, user: discord.Member, rainbet: str, kick: str):
-    try:
-        role_id = 1368886447209185351  # Replace with your actual role ID
-        role = discord.utils.get(interaction.guild.roles, id=role_id)
+    async def _link():
+        role_id = guild_configs.get(interaction.guild.id).affiliate_role_id
+        role = interaction.guild.get_role(role_id) if role_id else None
         if role:
-            await user.add_roles(role)
-
-        link_accounts(str(user.id), rainbet, kick)
+            await role_reconciler.submit(user, add=[role])
+
+        previous = await get_linked_accounts(str(user.id))
+        await link_accounts(str(user.id), rainbet, kick)
+        account_link_index.link(str(user.id), rainbet)
+        guild_linked_members.add(interaction.guild.id, str(user.id))
+        # Several Discord accounts may share a Rainbet username; it stays ranked while any is linked
+        if previous and not account_link_index.discord_ids(previous[0]):
+            wager_ranking.unlink(previous[0])
+        wager_ranking.link(rainbet, wager_history.wagered(current_month_window()[0], rainbet))
         print(f"Linking user ID {user.id} with Rainbet: {rainbet}, Kick: {kick}")
 
-
-        await interaction.response.send_message(
-            f"✅ Successfully linked accounts for {user.mention}!\nRainbet: `{rainbet}`\nKick: `{kick}`\nRole `{role.name}` assigned.",
-            ephemeral=True
+        return (
+            f"✅ Successfully linked accounts for {user.mention}!\nRainbet: `{rainbet}`\nKick: `{kick}`"
+            + (f"\nRole `{role.name}` assigned." if role else "")
         )
-    except Exception as e:
-        await interaction.response.send_message(f"❌ An error occurred: {str(e)}", ephemeral=True)
+
+    await run_deferred(interaction, ("link", interaction.guild.id, user.id, rainbet, kick), _link)
 
 
 
@@ -341,20 +1918,21 @@ async def link(interaction: discord.Interaction, user: discord.Member, rainbet:
 @app_commands.describe(user="The Discord user to unlink")
 @app_commands.checks.has_permissions(administrator=True)
 async def unlink(interaction: discord.Interaction, user: discord.Member):
-    with get_connection() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute("DELETE FROM account_links WHERE discord_id = %s;", (str(user.id),))
-            if cursor.rowcount == 0:
-                await interaction.response.send_message(f"⚠️ No linked account found for {user.mention}.", ephemeral=True)
-            else:
-                conn.commit()
-                affiliate_role = discord.utils.get(interaction.guild.roles, id=1368886447209185351)
-                if affiliate_role and affiliate_role in user.roles:
-                    await user.remove_roles(affiliate_role)
-                await interaction.response.send_message(
-                    f"✅ Accounts for {user.mention} have been unlinked and the **Degen Syndicate** role removed.",
-                    ephemeral=True
-                )
+    async def _unlink():
+        previous = await get_linked_accounts(str(user.id))
+        if await unlink_accounts(str(user.id)) == 0:
+            return f"⚠️ No linked account found for {user.mention}."
+
+        account_link_index.unlink(str(user.id))
+        if not account_link_index.discord_ids(previous[0]):
+            wager_ranking.unlink(previous[0])
+        role_id = guild_configs.get(interaction.guild.id).affiliate_role_id
+        affiliate_role = interaction.guild.get_role(role_id) if role_id else None
+        if affiliate_role and affiliate_role in user.roles:
+            await role_reconciler.submit(user, remove=[affiliate_role])
+        return f"✅ Accounts for {user.mention} have been unlinked and the **Degen Syndicate** role removed."
+
+    await run_deferred(interaction, ("unlink", interaction.guild.id, user.id), _unlink)
 
 
                 
@@ -362,155 +1940,1150 @@ async def unlink(interaction: discord.Interaction, user: discord.Member):
 @app_commands.describe(user="The user you want to query.")
 @app_commands.checks.has_permissions(administrator=True)
 async def accinfo(interaction: discord.Interaction, user: discord.User):
-    data = get_linked_accounts(str(user.id))
-    if not data:
-        await interaction.response.send_message(f"❌ No account links found for {user.mention}.", ephemeral=True)
-    else:
+    async def _accinfo():
+        data = await get_linked_accounts(str(user.id))
+        if not data:
+            return f"❌ No account links found for {user.mention}."
+
         rainbet, kick = data
-        await interaction.response.send_message(
-            f"👤 Linked accounts for {user.mention}:\nRainbet: `{rainbet}`\nKick: `{kick}`", ephemeral=True
+        try:
+            wagered = await lookup_wager(rainbet)
+            wager_line = f"`{wagered:.2f}`" if wagered is not None else "not found"
+        except Exception:
+            wager_line = "unavailable"
+        return f"👤 Linked accounts for {user.mention}:\nRainbet: `{rainbet}`\nKick: `{kick}`\n💰 Wagered this month: {wager_line}"
+
+    await run_deferred(interaction, ("accinfo", user.id), _accinfo)
+
+LINK_IMPORT_MAX_BYTES = 2 * 1024 * 1024
+LINK_IMPORT_COLUMNS = {
+    # field -> accepted column names / JSON keys
+    "discord_id": ("discord_id", "discord"),
+    "rainbet_username": ("rainbet_username", "rainbet"),
+    "kick_username": ("kick_username", "kick"),
+}
+MEMBER_QUERY_CHUNK = 100  # user IDs per gateway member request, Discord's maximum
+
+def parse_link_import(filename: str, data: bytes):
+    # Returns (rows, errors) for a CSV file with a header row or a JSON list of objects.
+    # The last row for a discord_id wins, so one upsert never touches a row twice.
+    text = data.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        records = json.loads(text)
+        if not isinstance(records, list):
+            raise ValueError("expected a JSON list of objects")
+        numbered = enumerate(records, start=1)
+    else:
+        numbered = enumerate(csv.DictReader(io.StringIO(text)), start=2)
+
+    rows = {}
+    errors = []
+    for line, record in numbered:
+        if not isinstance(record, dict):
+            errors.append(f"row {line}: not an object")
+            continue
+        record = {str(key).strip().lower(): value for key, value in record.items() if key is not None}
+        values = {
+            field: next((str(record[name]).strip() for name in names if record.get(name) not in (None, "")), "")
+            for field, names in LINK_IMPORT_COLUMNS.items()
+        }
+        discord_id = values["discord_id"].strip("<@!>")
+        if not discord_id.isdigit():
+            errors.append(f"row {line}: invalid Discord ID `{values['discord_id']}`")
+        elif not values["rainbet_username"]:
+            errors.append(f"row {line}: missing Rainbet username")
+        else:
+            rows[discord_id] = (discord_id, values["rainbet_username"], values["kick_username"])
+    return list(rows.values()), errors
+
+async def resolve_members(guild: discord.Guild, member_ids):
+    # Returns (member_id -> Member with current roles, IDs that could not be looked up). Members are
+    # requested over the gateway 100 IDs at a time instead of one REST fetch each; IDs that aren't in
+    # the guild are left out of both. A chunk that times out is retried once, then reported as
+    # unresolved so callers don't mistake it for members that left. Without the members intent the
+    # member cache never sees role updates, so it is neither read nor filled here.
+    members = {}
+    unresolved = []
+    member_ids = list(member_ids)
+    for i in range(0, len(member_ids), MEMBER_QUERY_CHUNK):
+        chunk = member_ids[i:i + MEMBER_QUERY_CHUNK]
+        for attempt in range(2):
+            try:
+                found = await guild.query_members(user_ids=chunk, limit=len(chunk), cache=False)
+            except asyncio.TimeoutError:
+                continue
+            members.update((member.id, member) for member in found)
+            break
+        else:
+            print(f"⚠️ Member lookup timed out for {len(chunk)} IDs in guild {guild.id}")
+            unresolved.extend(chunk)
+    return members, unresolved
+
+class LinkExportWriter:
+    # Encodes exported rows as CSV or JSON straight into a binary file
+    def __init__(self, output, file_format: str):
+        self.output = output
+        self.format = file_format
+        self.count = 0
+        self._line = io.StringIO()
+        self._csv = csv.writer(self._line)
+        if file_format == "csv":
+            self._write_csv(LINK_FIELDS)
+        else:
+            output.write(b"[")
+
+    def write(self, row):
+        if self.format == "csv":
+            self._write_csv(row)
+        else:
+            self.output.write((b",\n" if self.count else b"\n") + json.dumps(dict(zip(LINK_FIELDS, row))).encode())
+        self.count += 1
+
+    def close(self):
+        if self.format == "json":
+            self.output.write(b"\n]\n")
+
+    def _write_csv(self, row):
+        self._csv.writerow(row)
+        self.output.write(self._line.getvalue().encode())
+        self._line.seek(0)
+        self._line.truncate()
+
+@bot.tree.command(name="link_import", description="Admin only – link many accounts at once from a CSV or JSON file.")
+@app_commands.describe(file="CSV with discord_id,rainbet,kick columns, or a JSON list of objects with those keys")
+@app_commands.checks.has_permissions(administrator=True)
+async def link_import(interaction: discord.Interaction, file: discord.Attachment):
+    async def _import():
+        if file.size > LINK_IMPORT_MAX_BYTES:
+            return f"❌ The file is too large (limit {LINK_IMPORT_MAX_BYTES // 1024} KB)."
+        try:
+            rows, errors = parse_link_import(file.filename, await file.read())
+        except ValueError as e:
+            return f"❌ Could not read `{file.filename}`: {str(e)}"
+
+        message = ""
+        if rows:
+            previous = await link_accounts_bulk(rows)
+            window_start = current_month_window()[0]
+            for discord_id, rainbet, _ in rows:
+                account_link_index.link(discord_id, rainbet)
+                if discord_id in previous and not account_link_index.discord_ids(previous[discord_id]):
+                    wager_ranking.unlink(previous[discord_id])
+                wager_ranking.link(rainbet, wager_history.wagered(window_start, rainbet))
+            message += f"✅ Linked `{len(rows)}` accounts ({len(rows) - len(previous)} new, {len(previous)} updated).\n"
+
+            role_id = guild_configs.get(interaction.guild.id).affiliate_role_id
+            role = interaction.guild.get_role(role_id) if role_id else None
+            if role:
+                members, unresolved = await resolve_members(
+                    interaction.guild, [int(discord_id) for discord_id, _, _ in rows]
+                )
+                for member_id in members:
+                    guild_linked_members.add(interaction.guild.id, str(member_id))
+                missing_role = [member for member in members.values() if role not in member.roles]
+                # The reconciler merges and paces the edits; they finish in the background
+                for member in missing_role:
+                    future = role_reconciler.submit(member, add=[role], background=True)
+                    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                message += (
+                    f"🎖️ Role `{role.name}` queued for `{len(missing_role)}` members"
+                    f" ({len(rows) - len(members) - len(unresolved)} not in this server).\n"
+                )
+                if unresolved:
+                    message += f"⚠️ `{len(unresolved)}` members could not be looked up (Discord timed out); run the import again for them.\n"
+        else:
+            message += "❌ No valid rows found.\n"
+
+        if errors:
+            message += f"⚠️ Skipped `{len(errors)}` rows:\n" + "".join(f"• {error}\n" for error in errors[:10])
+            if len(errors) > 10:
+                message += f"… and {len(errors) - 10} more.\n"
+        return message
+
+    await run_deferred(interaction, ("link_import", interaction.guild.id, file.id), _import)
+
+@bot.tree.command(name="link_export", description="Admin only – download all linked accounts as CSV or JSON.")
+@app_commands.describe(file_format="File format (default: csv)")
+@app_commands.checks.has_permissions(administrator=True)
+async def link_export(interaction: discord.Interaction, file_format: Literal["csv", "json"] = "csv"):
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    # Rows stream from a server-side cursor into a temporary file, never all held in memory
+    async with link_export_lock:
+        with tempfile.TemporaryFile() as output:
+            try:
+                writer = LinkExportWriter(output, file_format)
+                await stream_linked_accounts(writer.write)
+                writer.close()
+                output.seek(0)
+                await interaction.followup.send(
+                    f"📤 Exported `{writer.count}` linked accounts.",
+                    file=discord.File(output, filename=f"account_links.{file_format}"),
+                    ephemeral=True
+                )
+            except Exception as e:
+                await interaction.followup.send(f"❌ Export failed: {str(e)}", ephemeral=True)
+
+# ===== Wager Sync =====
+# Periodically pushes milestone roles to every linked member from one affiliate snapshot,
+# instead of waiting for each user to run /progress.
+WAGER_SYNC_INTERVAL = float(os.getenv("WAGER_SYNC_INTERVAL", "600"))  # seconds, 0 disables the task
+WAGER_SYNC_DRY_RUN = os.getenv("WAGER_SYNC_DRY_RUN", "false").lower() == "true"
+
+wager_sync_lock = asyncio.Lock()
+wager_sync_stats = {}
+
+async def sync_wager_roles(dry_run: bool):
+    async with wager_sync_lock:
+        started = time.perf_counter()
+        snapshot = await affiliate_cache.get(*current_month_window(), allow_stale=False)
+        # Reloaded every sync so links made by other shard processes are picked up too
+        await account_link_index.load()
+        fetched = time.perf_counter()
+
+        planned = []
+        members_checked = 0
+        errors = 0
+        for guild in bot.guilds:
+            milestones = await milestone_cache.get(str(guild.id))
+            if not milestones:
+                continue
+            # Below the first tier nothing can change, so those members are never looked up
+            wagers = {
+                int(discord_id): wagered
+                for discord_id, wagered in account_link_index.join(snapshot)
+                if wagered >= milestones.thresholds[0]
+            }
+            members, unresolved = await resolve_members(guild, list(wagers))
+            # Members whose lookup timed out were not checked, so they count as errors
+            errors += len(unresolved)
+            members_checked += len(members)
+            for member_id, member in members.items():
+                role, roles_to_remove = plan_milestone_roles(guild, member, milestones, wagers[member_id])
+                if role:
+                    planned.append((member, role, roles_to_remove))
+        diffed = time.perf_counter()
+
+        applied = 0
+        if not dry_run:
+            # The reconciler paces the edits against the guild's rate-limit budget
+            results = await asyncio.gather(
+                *(role_reconciler.submit(member, add=[role], remove=roles_to_remove, background=True)
+                  for member, role, roles_to_remove in planned),
+                return_exceptions=True
+            )
+            for (member, _, _), result in zip(planned, results):
+                if isinstance(result, Exception):
+                    errors += 1
+                    print(f"⚠️ Wager sync could not update roles for {member}: {result}")
+                elif result:
+                    applied += 1
+        finished = time.perf_counter()
+
+        wager_sync_stats.update({
+            "dry_run": dry_run,
+            "finished_at": datetime.now(),
+            "linked_accounts": len(account_link_index),
+            "members_checked": members_checked,
+            "planned": len(planned),
+            "applied": applied,
+            "errors": errors,
+            "fetch_ms": (fetched - started) * 1000,
+            "diff_ms": (diffed - fetched) * 1000,
+            "apply_ms": (finished - diffed) * 1000,
+        })
+        return dict(wager_sync_stats)
+
+def format_wager_sync_stats(stats: dict):
+    mode = "dry run" if stats["dry_run"] else "applied"
+    return (
+        f"Last run: `{stats['finished_at']:%Y-%m-%d %H:%M:%S}` ({mode})\n"
+        f"Linked: `{stats['linked_accounts']}` | Checked: `{stats['members_checked']}` | "
+        f"Changes planned: `{stats['planned']}` | Applied: `{stats['applied']}` | Errors: `{stats['errors']}`\n"
+        f"Fetch: `{stats['fetch_ms']:.0f}ms` | Diff: `{stats['diff_ms']:.0f}ms` | Apply: `{stats['apply_ms']:.0f}ms`\n"
+    )
+
+@tasks.loop(seconds=max(WAGER_SYNC_INTERVAL, 1))
+async def wager_sync_loop():
+    try:
+        await sync_wager_roles(WAGER_SYNC_DRY_RUN)
+    except Exception as e:
+        print(f"⚠️ Wager sync failed: {e}")
+
+@wager_sync_loop.before_loop
+async def before_wager_sync():
+    await bot.wait_until_ready()
+
+@bot.tree.command(name="wager_sync", description="Admin only – sync milestone roles for all linked members now.")
+@app_commands.describe(dry_run="Only report the role changes without applying them")
+@app_commands.checks.has_permissions(administrator=True)
+async def wager_sync(interaction: discord.Interaction, dry_run: bool = True):
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    try:
+        stats = await sync_wager_roles(dry_run)
+        await interaction.followup.send("**🔄 Wager sync finished**\n" + format_wager_sync_stats(stats), ephemeral=True)
+    except Exception as e:
+        await interaction.followup.send(f"❌ Wager sync failed: {str(e)}", ephemeral=True)
+
+def format_overview_stats():
+    uptime = time.monotonic() - getattr(bot, "started_at", time.monotonic())
+    message = f"**📊 Overview** – up `{uptime / 3600:.1f}h`\n"
+    lag = metrics.histograms.get(("event_loop_lag_seconds", "loop"))
+    if lag is not None:
+        last = metrics.gauges.get(("event_loop_lag_last_seconds", "loop"), 0.0)
+        message += f"Event-loop lag: last `{last * 1000:.0f}ms` | p99 ≤ `{lag.quantile(0.99) * 1000:.0f}ms` | max `{lag.max * 1000:.0f}ms`\n"
+
+    message += "\n**⌨️ Commands**\n"
+    percentiles = command_latency.percentiles()
+    for name in metrics.targets("command_duration_seconds"):
+        count, p50, p95, p99 = percentiles.get(name, (0, 0.0, 0.0, 0.0))
+        errors = metrics.counters.get(("command_errors_total", name), 0)
+        running = metrics.gauges.get(("command_in_flight", name), 0)
+        message += (
+            f"• `/{name}` ({count}) – p50 `{p50 * 1000:.0f}ms` | p95 `{p95 * 1000:.0f}ms` | p99 `{p99 * 1000:.0f}ms` | "
+            f"errors `{errors}` | running `{running}`\n"
         )
 
-#region tournaments
-bot.tournament_state = {
-    "participants": set(),
-    "final_four": [],
-    "hall_of_fame_message_id": None
+    for kind, title in (("db", "🗄️ Database calls"), ("rainbet", "🌐 Rainbet API calls")):
+        message += f"\n**{title}**\n"
+        for target in metrics.targets(f"{kind}_duration_seconds"):
+            histogram = metrics.histograms[(f"{kind}_duration_seconds", target)]
+            errors = metrics.counters.get((f"{kind}_errors_total", target), 0)
+            running = metrics.gauges.get((f"{kind}_in_flight", target), 0)
+            message += (
+                f"• `{target}` ({histogram.count}) – avg `{histogram.sum / histogram.count * 1000:.0f}ms` | "
+                f"p95 ≤ `{histogram.quantile(0.95) * 1000:.0f}ms` | max `{histogram.max * 1000:.0f}ms` | "
+                f"errors `{errors}` | running `{running}`\n"
+            )
+    return message
+
+def format_cache_stats():
+    stats = affiliate_cache.stats()
+    message = (
+        "**📈 Affiliate snapshot cache**\n"
+        f"Hits: `{stats['hits']}` | Stale hits: `{stats['stale_hits']}` | Misses: `{stats['misses']}` "
+        f"({stats['hit_ratio']:.0%} served from cache)\n"
+        f"Fetches: `{stats['fetches']}` | Errors: `{stats['errors']}` | In flight: `{stats['in_flight']}` | TTL: `{stats['ttl']:.0f}s`\n"
+    )
+    for window, age in stats["ages"].items():
+        message += f"• `{window}` – {age:.0f}s old\n"
+
+    history = wager_history.stats()
+    message += (
+        "\n**🗂️ Wager history**\n"
+        f"Ingests: `{history['ingests']}` | Rows written: `{history['rows_written']}` | Last ingest: `{history['last_ingest_ms']:.0f}ms`\n"
+    )
+    for window, users in history["windows"].items():
+        message += f"• `{window}` – {users} users tracked\n"
+
+    render = render_cache.stats()
+    message += (
+        "\n**🖼️ Rendered messages**\n"
+        f"Hits: `{render['hits']}` | Misses: `{render['misses']}` ({render['hit_ratio']:.0%} served from cache) "
+        f"| Entries: `{render['size']}` / `{render['max_size']}`\n"
+    )
+
+    if wager_sync_stats:
+        message += "\n**🔄 Wager sync**\n" + format_wager_sync_stats(wager_sync_stats)
+    return message
+
+def format_database_stats():
+    pool = db.stats()
+    return (
+        "**🗄️ Database pool**\n"
+        f"In use: `{pool['in_use']}` | Idle: `{pool['idle']}` | Max: `{pool['max_size']}`\n"
+        f"Acquisitions: `{pool['acquisitions']}` | Avg wait: `{pool['avg_wait_ms']:.1f}ms` | Max wait: `{pool['max_wait_ms']:.1f}ms`\n"
+        f"Acquire timeouts: `{pool['timeouts']}` | Failed health checks: `{pool['health_check_failures']}`\n"
+    )
+
+def format_job_stats():
+    jobs = job_pool.stats()
+    message = (
+        "**⏱️ Command jobs**\n"
+        f"Queued: `{jobs['queued']}` | In flight: `{jobs['in_flight']}` | Submitted: `{jobs['submitted']}` | "
+        f"Shared: `{jobs['deduplicated']}` | Rejected: `{jobs['rejected']}` | Failed: `{jobs['failed']}`\n"
+    )
+
+    roles = role_reconciler.stats()
+    message += (
+        "\n**🎖️ Role reconciliation**\n"
+        f"Queue depth: `{roles['queue_depth']}` | Submitted: `{roles['submitted']}` | Merged: `{roles['merged']}` | "
+        f"Edits: `{roles['edits']}` ({roles['edits_per_second']:.2f}/s over 60s) | No-ops: `{roles['noops']}` | Errors: `{roles['errors']}`\n"
+        f"429s on member edits: `{roles['rate_limited']}` | 429s overall: `{roles['rate_limited_total']}`\n"
+    )
+
+    counts = [pinned.stats() for pinned in pinned_messages.values()]
+    message += (
+        "\n**📌 Status messages**\n"
+        f"Messages: `{len(counts)}` | Requests: `{sum(c['requests'] for c in counts)}` | "
+        f"Edits: `{sum(c['edits'] for c in counts)}` | Unchanged: `{sum(c['skipped'] for c in counts)}`\n"
+    )
+    return message
+
+def format_tournament_stats():
+    tournaments = tournament_store.stats()
+    return (
+        "**🎰 Tournaments**\n"
+        f"Open: `{tournaments['open']}` | Participants: `{tournaments['participants']}` | "
+        f"Reaction events: `{tournaments['events']}` | Persisted: `{tournaments['flushed']}` | Buffered: `{tournaments['buffered']}`\n"
+    )
+
+BOTSTATS_SECTIONS = {
+    "overview": format_overview_stats,
+    "caches": format_cache_stats,
+    "database": format_database_stats,
+    "jobs": format_job_stats,
+    "tournaments": format_tournament_stats,
+    "shards": lambda: "**🧩 Shards**\n" + format_shard_stats(),
 }
 
-# Ensure database table exists
-def init_tournament_db():
-    with get_connection() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS tournament_winners (
-                    user_id TEXT PRIMARY KEY,
-                    wins INTEGER NOT NULL
-                );
-            """)
-            conn.commit()
+@bot.tree.command(name="botstats", description="Admin only – show internal performance statistics.")
+@app_commands.describe(section="Which statistics to show (default: overview)")
+@app_commands.checks.has_permissions(administrator=True)
+async def botstats(
+    interaction: discord.Interaction,
+    section: Literal["overview", "caches", "database", "jobs", "tournaments", "shards"] = "overview"
+):
+    message = BOTSTATS_SECTIONS[section]()
+    if len(message) > 2000:
+        message = message[:1997] + "…"
+    await interaction.response.send_message(message, ephemeral=True)
+
+def format_shard_stats():
+    shard_ids = sorted(bot.shards)
+    message = (
+        f"Shards here: `{len(shard_ids)}` of `{bot.shard_count}` | Guilds: `{len(bot.guilds)}` | "
+        f"Configured guilds: `{len(guild_configs)}`\n"
+    )
+    guild_counts = {}
+    for guild in bot.guilds:
+        guild_counts[guild.shard_id] = guild_counts.get(guild.shard_id, 0) + 1
+    for shard_id, latency in bot.latencies:
+        message += f"• Shard `{shard_id}` – {guild_counts.get(shard_id, 0)} guilds, {latency * 1000:.0f}ms latency\n"
+    return message
+
+@bot.tree.command(name="config", description="Admin only – show or change this server's channel and role settings.")
+@app_commands.describe(
+    progress_channel="Channel where /progress may be used",
+    link_channel="Channel for account linking",
+    affiliate_role="Role assigned to linked affiliates",
+    verified_role="Role for verified members",
+    hall_of_fame_channel="Channel for the tournament Hall of Fame message",
+    leaderboard_channel="Channel for the wager leaderboard message",
+    clear="Setting to remove, e.g. to lift the /progress channel restriction"
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def config(
+    interaction: discord.Interaction,
+    progress_channel: discord.TextChannel = None,
+    link_channel: discord.TextChannel = None,
+    affiliate_role: discord.Role = None,
+    verified_role: discord.Role = None,
+    hall_of_fame_channel: discord.TextChannel = None,
+    leaderboard_channel: discord.TextChannel = None,
+    clear: Literal[
+        "progress_channel", "link_channel", "affiliate_role", "verified_role", "hall_of_fame_channel", "leaderboard_channel"
+    ] = None
+):
+    changes = {
+        field: value.id
+        for field, value in (
+            ("progress_channel_id", progress_channel),
+            ("link_channel_id", link_channel),
+            ("affiliate_role_id", affiliate_role),
+            ("verified_role_id", verified_role),
+            ("hall_of_fame_channel_id", hall_of_fame_channel),
+            ("leaderboard_channel_id", leaderboard_channel),
+        )
+        if value is not None
+    }
+    if clear:
+        changes[f"{clear}_id"] = None
+
+    async def _config():
+        try:
+            settings = guild_configs.get(interaction.guild.id)
+            if changes:
+                settings = await guild_configs.update(interaction.guild.id, **changes)
+
+            message = "**⚙️ Server configuration**\n" if not changes else "✅ Configuration updated.\n"
+            for field in GUILD_CONFIG_FIELDS:
+                value = getattr(settings, field)
+                mention = "not set" if not value else (f"<@&{value}>" if field.endswith("role_id") else f"<#{value}>")
+                message += f"• {field.removesuffix('_id').replace('_', ' ')}: {mention}\n"
+            return message
+        except Exception as e:
+            return f"❌ Error updating configuration: {str(e)}"
+
+    await run_deferred(interaction, ("config", interaction.guild.id, tuple(sorted(changes.items()))), _config)
+
+# ===== Pinned Messages =====
+PINNED_MESSAGE_DEBOUNCE = float(os.getenv("PINNED_MESSAGE_DEBOUNCE", "5"))  # seconds to collect updates before editing
+
+class PinnedMessage:
+    # A bot-owned status message that is edited in place. The message ID and a hash of the last
+    # posted content are stored in pinned_messages, so restarts keep editing the same message and
+    # unchanged content is never re-sent. Update requests within the debounce window share one edit.
+    def __init__(self, key: str, channel_id: int, render, debounce: float = PINNED_MESSAGE_DEBOUNCE, pin: bool = False):
+        self.key = key
+        self.channel_id = channel_id
+        self.render = render  # async () -> str
+        self.debounce = debounce
+        self.pin = pin
+        self.message_id = None
+        self._posted_channel_id = None
+        self._content_hash = None
+        self._loaded = False
+        self._dirty = False
+        self._task = None
+        self.requests = 0
+        self.edits = 0
+        self.skipped = 0
+
+    def request_update(self):
+        self.requests += 1
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        # Requests arriving while an edit is in progress trigger one more pass afterwards
+        while self._dirty:
+            await asyncio.sleep(self.debounce)
+            self._dirty = False
+            try:
+                await self._update()
+            except Exception as e:
+                print(f"⚠️ Could not update the {self.key} message: {e}")
+
+    async def _load(self):
+        row = await db.fetchone(
+            "SELECT channel_id, message_id, content_hash FROM pinned_messages WHERE key = %s;", (self.key,), name="load_pinned_message"
+        )
+        if row:
+            self._posted_channel_id, self.message_id, self._content_hash = int(row[0]), int(row[1]), row[2]
+        self._loaded = True
 
-async def update_hall_of_fame():
-    with get_connection() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT user_id, wins FROM tournament_winners ORDER BY wins DESC LIMIT 10;")
-            rows = cursor.fetchall()
-    HALL_OF_FAME_CHANNEL_ID= 1368886530969702463
-    channel = bot.get_channel(HALL_OF_FAME_CHANNEL_ID)
-    if not channel:
+    async def _update(self):
+        channel = bot.get_channel(self.channel_id)
+        if not channel:
+            return
+        if not self._loaded:
+            await self._load()
+
+        content = await self.render()
+        content_hash = hashlib.sha256(content.encode()).hexdigest()
+        same_channel = self._posted_channel_id == self.channel_id
+        if same_channel and self.message_id and content_hash == self._content_hash:
+            self.skipped += 1
+            return
+
+        posted = False
+        if same_channel and self.message_id:
+            try:
+                # Partial message: edits without fetching the message first
+                await channel.get_partial_message(self.message_id).edit(content=content)
+                posted = True
+            except discord.NotFound:
+                pass
+        if not posted:
+            msg = await channel.send(content)
+            self.message_id = msg.id
+            self._posted_channel_id = self.channel_id
+            if self.pin:
+                try:
+                    await msg.pin()
+                except discord.HTTPException:
+                    pass
+        self.edits += 1
+        self._content_hash = content_hash
+
+        await db.execute("""
+            INSERT INTO pinned_messages (key, channel_id, message_id, content_hash)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (key) DO UPDATE SET
+                channel_id = EXCLUDED.channel_id,
+                message_id = EXCLUDED.message_id,
+                content_hash = EXCLUDED.content_hash;
+        """, (self.key, str(self.channel_id), str(self.message_id), content_hash), name="save_pinned_message")
+
+    def stats(self):
+        return {"requests": self.requests, "edits": self.edits, "skipped": self.skipped}
+
+pinned_messages = {}  # key -> PinnedMessage
+
+def request_guild_message_update(kind: str, guild_id: int, channel_id: int, render, pin: bool = False):
+    # One PinnedMessage per (kind, guild); the channel follows the guild config
+    if not channel_id:
         return
+    key = f"{kind}:{guild_id}"
+    pinned = pinned_messages.get(key)
+    if pinned is None:
+        pinned = pinned_messages[key] = PinnedMessage(key, channel_id, render, pin=pin)
+    pinned.channel_id = channel_id
+    pinned.request_update()
+
+#region leaderboard
+LEADERBOARD_PAGE_SIZE = 10
+LEADERBOARD_MEMBERS_TTL = float(os.getenv("LEADERBOARD_MEMBERS_TTL", "900"))  # seconds before a guild's members are re-resolved
+
+class WagerRanking:
+    # Linked affiliates ordered by current-month wager. Kept sorted as (-wagered, username) keys
+    # and patched per changed user, so each guild's view is one filtering pass in rank order;
+    # the full list is only sorted once at startup.
+    def __init__(self):
+        self.window_start = None
+        self._keys = []       # sorted (-wagered, username)
+        self._amounts = {}    # username -> wagered, for ranked users
+        self._linked = {}     # case-folded Rainbet username -> display name
+
+    def rebuild(self, window_start: str, latest: AffiliateSnapshot, links):
+        self.window_start = window_start
+        self._linked = {rainbet.casefold(): rainbet for _, rainbet in links}
+        self._amounts = {}
+        for username in self._linked:
+            amount = latest.wagered(username)
+            if amount is not None:
+                self._amounts[username] = amount
+        self._keys = sorted((-amount, u) for u, amount in self._amounts.items())
+
+    def update(self, window_start: str, changed):
+        if window_start != self.window_start:
+            # New month: the ranking starts empty and fills from the first ingest of the window
+            self.window_start = window_start
+            self._keys = []
+            self._amounts = {}
+        for username, amount in changed:
+            if username in self._linked:
+                self._set(username, amount)
+
+    def link(self, rainbet_username: str, wagered):
+        username = rainbet_username.casefold()
+        self._linked[username] = rainbet_username
+        if wagered is not None:
+            self._set(username, wagered)
+
+    def unlink(self, rainbet_username: str):
+        username = rainbet_username.casefold()
+        self._linked.pop(username, None)
+        amount = self._amounts.pop(username, None)
+        if amount is not None:
+            del self._keys[bisect_left(self._keys, (-amount, username))]
+
+    def _set(self, username: str, amount: float):
+        old = self._amounts.get(username)
+        if old == amount:
+            return
+        if old is not None:
+            del self._keys[bisect_left(self._keys, (-old, username))]
+        insort(self._keys, (-amount, username))
+        self._amounts[username] = amount
+
+    def __len__(self):
+        return len(self._keys)
+
+    def view(self, keep):
+        # [(username, display name, wagered)] in rank order for the ranked usernames keep() accepts
+        return [
+            (username, self._linked.get(username, username), -neg_amount)
+            for neg_amount, username in self._keys
+            if keep(username)
+        ]
+
+wager_ranking = WagerRanking()
+
+class GuildLinkedMembers:
+    # Per guild, the linked Discord IDs that are members of it, so every community only sees its own
+    # members in the ranking. Resolved over the gateway and refreshed in the background once older than
+    # LEADERBOARD_MEMBERS_TTL; /link and /link_import add members as they link them.
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._members = {}   # guild_id -> (resolved_at, set of discord_id strings)
+        self._inflight = {}  # guild_id -> asyncio.Task
+
+    async def get(self, guild: discord.Guild):
+        entry = self._members.get(guild.id)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        task = self._inflight.get(guild.id)
+        if task is None:
+            task = self._inflight[guild.id] = asyncio.create_task(self._resolve(guild))
+            task.add_done_callback(self._resolved)
+        if entry:
+            return entry[1]
+        return await asyncio.shield(task)
+
+    async def _resolve(self, guild: discord.Guild):
+        try:
+            members, unresolved = await resolve_members(
+                guild, [int(discord_id) for discord_id, _ in account_link_index.links()]
+            )
+        finally:
+            self._inflight.pop(guild.id, None)
+        member_ids = {str(member_id) for member_id in members}
+        # A timed-out lookup keeps what the previous resolve knew about those members
+        entry = self._members.get(guild.id)
+        if entry and unresolved:
+            member_ids |= entry[1] & {str(member_id) for member_id in unresolved}
+        self._members[guild.id] = (time.monotonic(), member_ids)
+        return member_ids
+
+    @staticmethod
+    def _resolved(task):
+        # Mark failures as retrieved; a caller waiting on the first resolve still sees them
+        if not task.cancelled():
+            task.exception()
+
+    def add(self, guild_id: int, discord_id: str):
+        entry = self._members.get(guild_id)
+        if entry:
+            entry[1].add(discord_id)
+
+guild_linked_members = GuildLinkedMembers(LEADERBOARD_MEMBERS_TTL)
+
+async def guild_ranking(guild: discord.Guild):
+    # The wager ranking limited to Rainbet accounts linked by members of this guild
+    members = await guild_linked_members.get(guild)
+    return wager_ranking.view(lambda username: not members.isdisjoint(account_link_index.discord_ids(username)))
+
+def leaderboard_page_count(entries):
+    return max(1, -(-len(entries) // LEADERBOARD_PAGE_SIZE))
+
+def render_leaderboard(entries, page: int):
+    description = f"**💰 Wager Leaderboard – {wager_ranking.window_start or 'this month'} 💰**\n\n"
+    start = (page - 1) * LEADERBOARD_PAGE_SIZE
+    for rank, (_, name, amount) in enumerate(entries[start:start + LEADERBOARD_PAGE_SIZE], start=start + 1):
+        description += f"{rank}. `{name}` — **{amount:,.2f}** wagered\n"
+    if not entries:
+        description += "No wagers recorded yet.\n"
+    return description
+
+async def render_leaderboard_message(guild_id: int):
+    guild = bot.get_guild(guild_id)
+    return render_leaderboard(await guild_ranking(guild) if guild else [], 1)
+
+def on_wager_changes(window_start: str, changed):
+    wager_ranking.update(window_start, changed)
+    for guild in bot.guilds:
+        channel_id = guild_configs.get(guild.id).leaderboard_channel_id
+        request_guild_message_update(
+            "wager_leaderboard", guild.id, channel_id,
+            lambda guild_id=guild.id: render_leaderboard_message(guild_id), pin=True
+        )
+
+wager_history.listeners.append(on_wager_changes)
+
+@bot.tree.command(name="leaderboard", description="Show the monthly wager leaderboard.")
+@app_commands.describe(page="Leaderboard page to show")
+async def leaderboard(interaction: discord.Interaction, page: app_commands.Range[int, 1] = 1):
+    async def _leaderboard():
+        entries = await guild_ranking(interaction.guild)
+        shown = min(page, leaderboard_page_count(entries))
+        message = render_leaderboard(entries, shown)
+        message += f"\nPage {shown}/{leaderboard_page_count(entries)}"
+
+        result = await get_linked_accounts(str(interaction.user.id))
+        if result:
+            username = result[0].casefold()
+            for rank, (ranked, _, amount) in enumerate(entries, start=1):
+                if ranked == username:
+                    message += f" | Your rank: **#{rank}** of {len(entries)} with `{amount:,.2f}`"
+                    break
+        return message
+
+    await run_deferred(interaction, ("leaderboard", interaction.guild.id, interaction.user.id, page), _leaderboard)
+
+#endregion
 
+#region tournaments
+TOURNAMENT_EMOJI = "🎰"
+TOURNAMENT_FLUSH_INTERVAL = float(os.getenv("TOURNAMENT_FLUSH_INTERVAL", "2"))  # seconds between reaction flushes
+TOURNAMENT_FLUSH_BATCH = int(os.getenv("TOURNAMENT_FLUSH_BATCH", "500"))  # flush early once this many events are buffered
+TOURNAMENT_RECONCILE_CHUNK = 1000  # participants merged per batch while walking reaction users
+
+class Tournament:
+    def __init__(self, message_id: int, guild_id: int, channel_id: int, final_four=None):
+        self.message_id = message_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.participants = set()
+        self.final_four = final_four or []
+        self.live_changes = None  # user IDs seen in live reaction events while a reconciliation runs
+
+class TournamentStore:
+    # Open tournaments keyed by registration message ID. Reactions only touch memory and a
+    # write-behind buffer of add/remove events; the buffer is appended to
+    # tournament_reaction_events in batches and replayed on startup.
+    def __init__(self):
+        self.tournaments = {}  # message_id -> Tournament, in creation order
+        self._buffer = []      # (message_id, user_id, added)
+        self._flush_lock = asyncio.Lock()
+        self.events = 0
+        self.flushed = 0
+
+    async def load(self):
+        rows = await db.fetchall("""
+            SELECT message_id, guild_id, channel_id, final_four
+            FROM tournaments
+            WHERE status = 'open'
+            ORDER BY created_at ASC;
+        """, name="load_tournaments")
+        # Other shard processes own the tournaments of their guilds
+        self.tournaments = {
+            int(message_id): Tournament(int(message_id), int(guild_id), int(channel_id), [int(u) for u in final_four])
+            for message_id, guild_id, channel_id, final_four in rows
+            if owns_guild(int(guild_id))
+        }
+        if not self.tournaments:
+            return
+
+        events = await db.fetchall("""
+            SELECT message_id, user_id, added
+            FROM tournament_reaction_events
+            WHERE message_id = ANY(%s)
+            ORDER BY id ASC;
+        """, ([str(message_id) for message_id in self.tournaments],), name="load_reaction_events")
+        for message_id, user_id, added in events:
+            participants = self.tournaments[int(message_id)].participants
+            if added:
+                participants.add(int(user_id))
+            else:
+                participants.discard(int(user_id))
+
+    async def start(self, message_id: int, guild_id: int, channel_id: int):
+        await db.execute(
+            "INSERT INTO tournaments (message_id, guild_id, channel_id) VALUES (%s, %s, %s);",
+            (str(message_id), str(guild_id), str(channel_id)), name="insert_tournament"
+        )
+        tournament = Tournament(message_id, guild_id, channel_id)
+        self.tournaments[message_id] = tournament
+        return tournament
+
+    def for_channel(self, channel_id: int):
+        # Most recently started open tournament in the channel
+        for tournament in reversed(list(self.tournaments.values())):
+            if tournament.channel_id == channel_id:
+                return tournament
+        return None
+
+    def record_reaction(self, message_id: int, user_id: int, added: bool):
+        tournament = self.tournaments.get(message_id)
+        if tournament is None:
+            return False
+        if tournament.live_changes is not None:
+            tournament.live_changes.add(user_id)
+        if added:
+            tournament.participants.add(user_id)
+        else:
+            tournament.participants.discard(user_id)
+        self._buffer.append((str(message_id), str(user_id), added))
+        self.events += 1
+        if len(self._buffer) >= TOURNAMENT_FLUSH_BATCH and not self._flush_lock.locked():
+            asyncio.create_task(self.flush())
+        return True
+
+    def merge(self, tournament: Tournament, user_ids, added: bool):
+        if added:
+            tournament.participants.update(user_ids)
+        else:
+            tournament.participants.difference_update(user_ids)
+        self._buffer.extend((str(tournament.message_id), str(user_id), added) for user_id in user_ids)
+        self.events += len(user_ids)
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+
+            def _append(conn):
+                with conn.cursor() as cursor:
+                    execute_values(
+                        cursor,
+                        "INSERT INTO tournament_reaction_events (message_id, user_id, added) VALUES %s;",
+                        batch, page_size=1000
+                    )
+
+            try:
+                await db.run(_append, name="append_reaction_events")
+            except Exception:
+                # Keep event order: the failed batch goes back in front of anything buffered since
+                self._buffer = batch + self._buffer
+                raise
+            self.flushed += len(batch)
+
+    async def set_final_four(self, tournament: Tournament, final_four):
+        tournament.final_four = final_four
+        await db.execute(
+            "UPDATE tournaments SET final_four = %s WHERE message_id = %s;",
+            ([str(u) for u in final_four], str(tournament.message_id)), name="set_final_four"
+        )
+
+    async def finish(self, tournament: Tournament):
+        # Reaction events are only needed to replay open tournaments, so a finished one's are deleted.
+        # Under the flush lock, so a flush in progress can't write its events after the delete.
+        message_id = str(tournament.message_id)
+
+        def _finish(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("UPDATE tournaments SET status = 'finished' WHERE message_id = %s;", (message_id,))
+                cursor.execute("DELETE FROM tournament_reaction_events WHERE message_id = %s;", (message_id,))
+
+        async with self._flush_lock:
+            await db.run(_finish, name="finish_tournament")
+            self._buffer = [event for event in self._buffer if event[0] != message_id]
+            self.tournaments.pop(tournament.message_id, None)
+
+    async def finish_channel(self, channel_id: int):
+        # Finishes every open tournament in the channel; returns how many there were
+        finished = 0
+        tournament = self.for_channel(channel_id)
+        while tournament is not None:
+            await self.finish(tournament)
+            finished += 1
+            tournament = self.for_channel(channel_id)
+        return finished
+
+    def stats(self):
+        return {
+            "open": len(self.tournaments),
+            "participants": sum(len(t.participants) for t in self.tournaments.values()),
+            "events": self.events,
+            "flushed": self.flushed,
+            "buffered": len(self._buffer),
+        }
+
+tournament_store = TournamentStore()
+
+@tasks.loop(seconds=TOURNAMENT_FLUSH_INTERVAL)
+async def tournament_flush_loop():
+    try:
+        await tournament_store.flush()
+    except Exception as e:
+        print(f"⚠️ Could not flush tournament reactions: {e}")
+
+async def reconcile_tournament(tournament: Tournament):
+    # Walks the registration message's 🎰 reactions (discord.py pages them 100 at a time) and merges
+    # users missed while the bot was offline. Additions are merged in chunks and removals at the end;
+    # users with a live reaction event during the walk are left as those events set them.
+    started = time.perf_counter()
+    channel = bot.get_channel(tournament.channel_id) or await bot.fetch_channel(tournament.channel_id)
+    message = await channel.fetch_message(tournament.message_id)
+    fetched = time.perf_counter()
+
+    reaction = discord.utils.find(lambda r: str(r.emoji) == TOURNAMENT_EMOJI, message.reactions)
+    seen = set()
+    pending = []
+    added = 0
+    tournament.live_changes = set()
+
+    def merge_pending():
+        # A user seen on an earlier page may have un-reacted live since; the live event wins
+        fresh = [user_id for user_id in pending if user_id not in tournament.live_changes]
+        if fresh:
+            tournament_store.merge(tournament, fresh, True)
+        return len(fresh)
+
+    try:
+        if reaction:
+            async for user in reaction.users(limit=None):
+                if user.id == bot.user.id:
+                    continue
+                seen.add(user.id)
+                if user.id not in tournament.participants:
+                    pending.append(user.id)
+                    if len(pending) >= TOURNAMENT_RECONCILE_CHUNK:
+                        added += merge_pending()
+                        pending = []
+        added += merge_pending()
+        removed = list(tournament.participants - seen - tournament.live_changes)
+        if removed:
+            tournament_store.merge(tournament, removed, False)
+    finally:
+        tournament.live_changes = None
+    walked = time.perf_counter()
+
+    await tournament_store.flush()
+    finished = time.perf_counter()
+    return {
+        "message_id": tournament.message_id,
+        "reactions": len(seen),
+        "added": added,
+        "removed": len(removed),
+        "participants": len(tournament.participants),
+        "fetch_ms": (fetched - started) * 1000,
+        "walk_ms": (walked - fetched) * 1000,
+        "persist_ms": (finished - walked) * 1000,
+    }
+
+def format_reconcile_stats(stats: dict):
+    return (
+        f"• `{stats['message_id']}` – reactions: `{stats['reactions']}` | added: `{stats['added']}` | "
+        f"removed: `{stats['removed']}` | participants: `{stats['participants']}`\n"
+        f"  fetch `{stats['fetch_ms']:.0f}ms` | walk `{stats['walk_ms']:.0f}ms` | persist `{stats['persist_ms']:.0f}ms`\n"
+    )
+
+async def reconcile_open_tournaments():
+    await bot.wait_until_ready()
+    for tournament in list(tournament_store.tournaments.values()):
+        if bot.get_guild(tournament.guild_id) is None:
+            continue
+        try:
+            stats = await reconcile_tournament(tournament)
+            print("🎰 Reconciled tournament " + format_reconcile_stats(stats).strip())
+        except discord.HTTPException as e:
+            print(f"⚠️ Could not reconcile tournament {tournament.message_id}: {e}")
+
+async def render_hall_of_fame(guild_id: int):
+    rows = await db.fetchall(
+        "SELECT user_id, wins FROM tournament_winners WHERE guild_id = %s ORDER BY wins DESC LIMIT 10;",
+        (str(guild_id),), name="hall_of_fame"
+    )
     description = "**🏆 Hall of Fame – Tournament Winners 🏆**\n\n"
     for i, (user_id, wins) in enumerate(rows, start=1):
         description += f"{i}. <@{user_id}> — **{wins}** wins\n"
+    return description
 
-    # Try to edit existing message, otherwise send new one
-    try:
-        if bot.tournament_state["hall_of_fame_message_id"]:
-            msg = await channel.fetch_message(bot.tournament_state["hall_of_fame_message_id"])
-            await msg.edit(content=description)
-        else:
-            msg = await channel.send(description)
-            bot.tournament_state["hall_of_fame_message_id"] = msg.id
-    except:
-        msg = await channel.send(description)
-        bot.tournament_state["hall_of_fame_message_id"] = msg.id
 
 
 
 @bot.tree.command(name="tournament_start", description="Start a slot tournament (4 players).")
 @app_commands.checks.has_permissions(administrator=True)
 async def tournament_start(interaction: discord.Interaction):
-    init_tournament_db()
-    bot.tournament_state["participants"].clear()
-    bot.tournament_state["final_four"] = []
-    EMOJI = "🎰" 
+    async def _start():
+        # A channel has one tournament at a time; an unfinished previous one is abandoned
+        abandoned = await tournament_store.finish_channel(interaction.channel.id)
+        msg = await interaction.channel.send("🎰 **React to join the slot tournament!**\n"
+        "Only 4 will be randomly selected.\n\n"
+        "🏆 The winner receives a **$5 tip**!\n"
+        "💰 If both bonus buys are profitable, the prize will be **doubled to $10**!")
+        await tournament_store.start(msg.id, interaction.guild.id, interaction.channel.id)
+        await msg.add_reaction(TOURNAMENT_EMOJI)
 
-    msg = await interaction.channel.send("🎰 **React to join the slot tournament!**\n"
-    "Only 4 will be randomly selected.\n\n"
-    "🏆 The winner receives a **$5 tip**!\n"
-    "💰 If both bonus buys are profitable, the prize will be **doubled to $10**!")
-    await msg.add_reaction(EMOJI)
-    bot.tournament_state["reaction_message_id"] = msg.id
+        return "✅ Tournament registration started." + (" The previous unfinished tournament was closed." if abandoned else "")
 
-    await interaction.response.send_message("✅ Tournament registration started.", ephemeral=True)
+    await run_deferred(interaction, ("tournament_start", interaction.channel.id), _start)
 
 @bot.tree.command(name="tournament_close", description="Close registration and draw 4 random players.")
 @app_commands.checks.has_permissions(administrator=True)
 async def tournament_close(interaction: discord.Interaction):
-    participants = list(bot.tournament_state["participants"])
+    tournament = tournament_store.for_channel(interaction.channel_id)
+    if not tournament:
+        await interaction.response.send_message("⚠️ No open tournament in this channel.", ephemeral=True)
+        return
+
+    participants = list(tournament.participants)
     if len(participants) < 4:
         await interaction.response.send_message("⚠️ Not enough participants (need at least 4).", ephemeral=True)
         return
 
-    selected = random.sample(participants, 4)
-    bot.tournament_state["final_four"] = selected
+    async def _close():
+        selected = random.sample(participants, 4)
+        await tournament_store.set_final_four(tournament, selected)
 
-    mentions = " ".join(f"<@{uid}>" for uid in selected)
-    await interaction.channel.send(
-        f"🎯 **Selected participants:** {mentions}\n"
-        f"Please appear in the stream within the next **5 minutes**, or you will be replaced."
-    )
+        mentions = " ".join(f"<@{uid}>" for uid in selected)
+        await interaction.channel.send(
+            f"🎯 **Selected participants:** {mentions}\n"
+            f"Please appear in the stream within the next **5 minutes**, or you will be replaced."
+        )
+        return "✅ Final four selected."
 
-    await interaction.response.send_message("✅ Final four selected.", ephemeral=True)
+    await run_deferred(interaction, ("tournament_close", tournament.message_id), _close)
 
 
 @bot.tree.command(name="tournament_draw_backup", description="Draw a backup participant in case someone no-shows.")
 @app_commands.checks.has_permissions(administrator=True)
 async def tournament_draw_backup(interaction: discord.Interaction):
-    remaining = list(bot.tournament_state["participants"] - set(bot.tournament_state["final_four"]))
+    tournament = tournament_store.for_channel(interaction.channel_id)
+    if not tournament:
+        await interaction.response.send_message("⚠️ No open tournament in this channel.", ephemeral=True)
+        return
+
+    remaining = list(tournament.participants - set(tournament.final_four))
     if not remaining:
         await interaction.response.send_message("⚠️ No remaining participants available.", ephemeral=True)
         return
 
-    backup = random.choice(remaining)
-    bot.tournament_state["final_four"].append(backup)
+    async def _draw_backup():
+        backup = random.choice(remaining)
+        await tournament_store.set_final_four(tournament, tournament.final_four + [backup])
 
-    await interaction.channel.send(
-        f"🆕 Backup participant selected: <@{backup}>\nPlease appear in the stream within the next **5 minutes**!"
-    )
+        await interaction.channel.send(
+            f"🆕 Backup participant selected: <@{backup}>\nPlease appear in the stream within the next **5 minutes**!"
+        )
+        return "✅ Backup participant selected."
 
-    await interaction.response.send_message("✅ Backup participant selected.", ephemeral=True)
+    await run_deferred(interaction, ("tournament_draw_backup", tournament.message_id), _draw_backup)
 
 @bot.tree.command(name="tournament_winner", description="Set the winner of the tournament final.")
 @app_commands.checks.has_permissions(administrator=True)
 @app_commands.describe(user="The winner of the final round")
 async def tournament_winner(interaction: discord.Interaction, user: discord.User):
-    init_tournament_db()
-    with get_connection() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO tournament_winners (user_id, wins)
-                VALUES (%s, 1)
-                ON CONFLICT (user_id) DO UPDATE SET wins = tournament_winners.wins + 1;
-            """, (str(user.id),))
-            conn.commit()
+    async def _winner():
+        await db.execute("""
+            INSERT INTO tournament_winners (guild_id, user_id, wins)
+            VALUES (%s, %s, 1)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET wins = tournament_winners.wins + 1;
+        """, (str(interaction.guild.id), str(user.id)), name="record_tournament_winner")
+
+        tournament = tournament_store.for_channel(interaction.channel_id)
+        if tournament:
+            await tournament_store.finish(tournament)
+
+        channel_id = guild_configs.get(interaction.guild.id).hall_of_fame_channel_id
+        request_guild_message_update(
+            "hall_of_fame", interaction.guild.id, channel_id, lambda guild_id=interaction.guild.id: render_hall_of_fame(guild_id)
+        )
+        return "✅ Winner recorded – the Hall of Fame will update shortly."
+
+    await run_deferred(interaction, ("tournament_winner", interaction.channel_id, user.id), _winner)
 
-    await update_hall_of_fame()
+@bot.tree.command(name="tournament_reconcile", description="Re-read the registration reactions of this channel's tournament.")
+@app_commands.checks.has_permissions(administrator=True)
+async def tournament_reconcile(interaction: discord.Interaction):
+    tournament = tournament_store.for_channel(interaction.channel_id)
+    if not tournament:
+        await interaction.response.send_message("⚠️ No open tournament in this channel.", ephemeral=True)
+        return
 
-    await interaction.response.send_message("✅ Winner recorded and Hall of Fame updated.", ephemeral=True)
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    try:
+        stats = await reconcile_tournament(tournament)
+        await interaction.followup.send("✅ Registration reconciled.\n" + format_reconcile_stats(stats), ephemeral=True)
+    except Exception as e:
+        await interaction.followup.send(f"❌ Reconciliation failed: {str(e)}", ephemeral=True)
 
 @bot.event
 async def on_raw_reaction_add(payload):
-    EMOJI = "🎰" 
-    if payload.message_id != bot.tournament_state.get("reaction_message_id"):
+    if str(payload.emoji) != TOURNAMENT_EMOJI or payload.user_id == bot.user.id:
         return
-    if str(payload.emoji) != EMOJI:
+    tournament_store.record_reaction(payload.message_id, payload.user_id, True)
+
+@bot.event
+async def on_raw_reaction_remove(payload):
+    if str(payload.emoji) != TOURNAMENT_EMOJI or payload.user_id == bot.user.id:
         return
-    bot.tournament_state["participants"].add(payload.user_id)
+    tournament_store.record_reaction(payload.message_id, payload.user_id, False)
 
 #endregion
 
 # ===== Error Handling =====
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    record_command_latency(interaction)
+
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: Exception):
+    record_command_latency(interaction, failed=True)
+    # Deferred commands have already answered the interaction, so reply with a followup instead
+    send = interaction.followup.send if interaction.response.is_done() else interaction.response.send_message
     if isinstance(error, app_commands.errors.MissingPermissions):
-        await interaction.response.send_message("⛔ You do not have permission to use this command.", ephemeral=True)
+        await send("⛔ You do not have permission to use this command.", ephemeral=True)
     else:
-        await interaction.response.send_message("❌ An unexpected error occurred.", ephemeral=True)
+        await send("❌ An unexpected error occurred.", ephemeral=True)
         raise error
     
 
 
 # ===== Start Bot =====
-bot.run(os.getenv("DISCORD_TOKEN"))
+if __name__ == "__main__":
+    bot.run(os.getenv("DISCORD_TOKEN"))
@@ -0,0 +1,78 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rainbetbot import AffiliateStreamParser, RainbetAPIError
+
+PAYLOAD = {
+    "status": "ok",
+    "meta": {"page": 1, "range": [1, 2, {"nested": "}]"}]},
+    "affiliates": [
+        {"username": "plain", "wagered_amount": 1234.5},
+        {"username": "brace}name", "wagered_amount": 10},
+        {"username": "bracket]name", "wagered_amount": 0.25},
+        {"username": "ümlaut-🎰", "wagered_amount": 987654321.125},
+        {"username": "nested", "wagered_amount": 42, "stats": {"games": {"slots": 3}, "tags": ["}", "]"]}},
+        {"username": "quote\"}{", "wagered_amount": 7},
+        {"username": "last", "wagered_amount": 1e3},
+    ],
+    "total": 7,
+}
+
+
+def parse(chunks):
+    affiliates = []
+    parser = AffiliateStreamParser(lambda username, wagered: affiliates.append((username, wagered)))
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    return affiliates
+
+
+def expected(payload):
+    return [(affiliate["username"], affiliate["wagered_amount"]) for affiliate in payload["affiliates"]]
+
+
+class AffiliateStreamParserTest(unittest.TestCase):
+    def test_every_two_chunk_split(self):
+        # Covers splits inside keys, strings, numbers, multi-byte UTF-8 sequences and skipped fields
+        data = json.dumps(PAYLOAD, ensure_ascii=False).encode()
+        for cut in range(len(data) + 1):
+            with self.subTest(cut=cut):
+                self.assertEqual(parse([data[:cut], data[cut:]]), expected(PAYLOAD))
+
+    def test_byte_at_a_time(self):
+        data = json.dumps(PAYLOAD, ensure_ascii=False, indent=2).encode()
+        self.assertEqual(parse([data[i:i + 1] for i in range(len(data))]), expected(PAYLOAD))
+
+    def test_single_chunk(self):
+        data = json.dumps(PAYLOAD).encode()
+        self.assertEqual(parse([data]), expected(PAYLOAD))
+
+    def test_affiliates_only(self):
+        self.assertEqual(parse([b'{"affiliates": []}']), [])
+        self.assertEqual(parse([b'{"affiliates":[{"username":"a","wagered_amount":1}]}']), [("a", 1)])
+
+    def test_fields_after_affiliates_are_skipped(self):
+        data = b'{"affiliates": [{"username": "a", "wagered_amount": 5}], "next": {"affiliates": [1]}, "n": 12}'
+        for cut in range(len(data) + 1):
+            with self.subTest(cut=cut):
+                self.assertEqual(parse([data[:cut], data[cut:]]), [("a", 5)])
+
+    def test_truncated_payload(self):
+        data = json.dumps(PAYLOAD, ensure_ascii=False).encode()
+        for cut in range(len(data)):
+            with self.subTest(cut=cut), self.assertRaises(RainbetAPIError):
+                parse([data[:cut]])
+
+    def test_malformed_payload(self):
+        for data in (b'[]', b'{"affiliates" [] }', b'{"affiliates": [{"username": "a",}]}'):
+            with self.subTest(data=data), self.assertRaises(RainbetAPIError):
+                parse([data])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rainbetbot import JobPool
+
+
+class JobPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def test_cancelled_waiter_keeps_shared_job_and_worker(self):
+        pool = JobPool(1, 10)
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "shared"
+
+        async def fast():
+            return "next"
+
+        first = pool.submit("key", slow)
+        second = pool.submit("key", slow)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(first, 0.01)
+
+        self.assertEqual(await second, "shared")
+        self.assertEqual(await asyncio.wait_for(pool.submit("other", fast), 1), "next")
+        self.assertEqual(pool.stats()["deduplicated"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
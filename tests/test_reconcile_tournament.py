@@ -0,0 +1,71 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rainbetbot
+from rainbetbot import TOURNAMENT_EMOJI, Tournament, TournamentStore
+
+BOT_ID = 1
+
+
+class Reaction:
+    # reaction.users() paged like discord.py; on_page(n) runs before page n (from 1) is yielded
+    def __init__(self, pages, on_page):
+        self.emoji = TOURNAMENT_EMOJI
+        self.pages = pages
+        self.on_page = on_page
+
+    async def users(self, limit=None):
+        for number, page in enumerate(self.pages):
+            self.on_page(number)
+            for user_id in page:
+                yield SimpleNamespace(id=user_id)
+
+
+class ReconcileTournamentTest(unittest.IsolatedAsyncioTestCase):
+    async def reconcile(self, store, tournament, reaction):
+        message = SimpleNamespace(reactions=[reaction])
+        channel = SimpleNamespace(fetch_message=mock.AsyncMock(return_value=message))
+        with mock.patch.object(rainbetbot, "tournament_store", store), \
+                mock.patch.object(rainbetbot.bot, "get_channel", return_value=channel), \
+                mock.patch.object(rainbetbot.bot._connection, "user", SimpleNamespace(id=BOT_ID)), \
+                mock.patch.object(store, "flush", mock.AsyncMock()):
+            return await rainbetbot.reconcile_tournament(tournament)
+
+    async def test_live_removal_during_walk_wins(self):
+        store = TournamentStore()
+        tournament = Tournament(555, 1, 2)
+        store.tournaments[tournament.message_id] = tournament
+
+        def on_page(number):
+            if number == 1:
+                # User 1000 un-reacts after page 1 listed them, before the walk reaches page 2
+                store.record_reaction(555, 1000, False)
+
+        reaction = Reaction([[BOT_ID, 1000, 1001], [1002, 1003]], on_page)
+        stats = await self.reconcile(store, tournament, reaction)
+
+        self.assertEqual(tournament.participants, {1001, 1002, 1003})
+        self.assertEqual(stats["added"], 3)
+        events = [event for event in store._buffer if event[1] == "1000"]
+        self.assertEqual(events, [("555", "1000", False)])
+
+    async def test_offline_removal_is_dropped(self):
+        store = TournamentStore()
+        tournament = Tournament(555, 1, 2)
+        tournament.participants = {1000, 1001}
+        store.tournaments[tournament.message_id] = tournament
+
+        stats = await self.reconcile(store, tournament, Reaction([[1001, 1002]], lambda number: None))
+
+        self.assertEqual(tournament.participants, {1001, 1002})
+        self.assertEqual(stats["removed"], 1)
+        self.assertIn(("555", "1000", False), store._buffer)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import asyncio
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rainbetbot import MEMBER_QUERY_CHUNK, resolve_members
+
+
+class Guild:
+    # query_members like discord.Guild; timeouts[first_id] is how often the chunk starting there times out
+    def __init__(self, member_ids, timeouts):
+        self.id = 1
+        self.member_ids = set(member_ids)
+        self.timeouts = dict(timeouts)
+        self.queries = []
+
+    async def query_members(self, user_ids, limit, cache):
+        self.queries.append(user_ids)
+        if self.timeouts.get(user_ids[0], 0):
+            self.timeouts[user_ids[0]] -= 1
+            raise asyncio.TimeoutError
+        return [SimpleNamespace(id=user_id) for user_id in user_ids if user_id in self.member_ids]
+
+
+class ResolveMembersTest(unittest.IsolatedAsyncioTestCase):
+    async def test_timed_out_chunk_is_retried_once(self):
+        ids = list(range(MEMBER_QUERY_CHUNK + 10))
+        guild = Guild(ids[:-1], {MEMBER_QUERY_CHUNK: 1})
+
+        members, unresolved = await resolve_members(guild, ids)
+
+        self.assertEqual(set(members), set(ids[:-1]))
+        self.assertEqual(unresolved, [])
+        self.assertEqual(len(guild.queries), 3)
+
+    async def test_chunk_timing_out_twice_is_reported(self):
+        ids = list(range(MEMBER_QUERY_CHUNK + 10))
+        guild = Guild(ids, {0: 2})
+
+        members, unresolved = await resolve_members(guild, ids)
+
+        self.assertEqual(set(members), set(ids[MEMBER_QUERY_CHUNK:]))
+        self.assertEqual(unresolved, ids[:MEMBER_QUERY_CHUNK])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rainbetbot import RoleReconciler
+
+
+class Role:
+    def __init__(self, role_id):
+        self.id = role_id
+
+    def is_default(self):
+        return False
+
+
+class Guild:
+    def __init__(self, guild_id=1):
+        self.id = guild_id
+        self.server_roles = {}  # member_id -> role ids as Discord holds them
+
+
+class Member:
+    # Holds a cached role list like discord.Member; requests change the server side only
+    def __init__(self, guild, member_id, roles, log=None):
+        self.guild = guild
+        self.id = member_id
+        self.roles = list(roles)
+        self.log = log if log is not None else []
+        guild.server_roles[member_id] = {role.id for role in roles}
+
+    async def add_roles(self, *roles, reason=None):
+        for role in roles:
+            self.log.append(("add", self.id, role.id))
+            self.guild.server_roles[self.id].add(role.id)
+
+    async def remove_roles(self, *roles, reason=None):
+        for role in roles:
+            self.log.append(("remove", self.id, role.id))
+            self.guild.server_roles[self.id].discard(role.id)
+
+
+class RoleReconcilerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_role_added_elsewhere_survives(self):
+        guild = Guild()
+        tier_1, tier_2, moderator = Role(1), Role(2), Role(3)
+        member = Member(guild, 10, [tier_1])
+        # A moderator grants a role after our member object was cached
+        guild.server_roles[member.id].add(moderator.id)
+
+        reconciler = RoleReconciler(rate=1000, burst=10, workers=1)
+        self.assertTrue(await reconciler.submit(member, add=[tier_2], remove=[tier_1]))
+
+        self.assertEqual(guild.server_roles[member.id], {tier_2.id, moderator.id})
+
+    async def test_noop_when_member_already_matches(self):
+        guild = Guild()
+        tier_1 = Role(1)
+        member = Member(guild, 10, [tier_1])
+
+        reconciler = RoleReconciler(rate=1000, burst=10, workers=1)
+        self.assertFalse(await reconciler.submit(member, add=[tier_1]))
+        self.assertEqual(member.log, [])
+
+    async def test_interactive_submit_goes_before_background(self):
+        guild = Guild()
+        role = Role(1)
+        log = []
+        reconciler = RoleReconciler(rate=1000, burst=10, workers=1)
+        background = [
+            reconciler.submit(Member(guild, member_id, [], log), add=[role], background=True)
+            for member_id in range(1, 6)
+        ]
+        interactive = reconciler.submit(Member(guild, 99, [], log), add=[role])
+        await asyncio.gather(interactive, *background)
+
+        self.assertEqual(log[0], ("add", 99, role.id))
+
+
+if __name__ == "__main__":
+    unittest.main()